@@ -0,0 +1,159 @@
+# backend/ann.py
+"""
+IVF-flat approximate nearest-neighbour index over unit-normalised rows.
+
+Build: spherical k-means (NumPy only) splits the rows into `nlist` inverted
+lists. Search: score the query against the centroids, then do exact cosine
+over the rows of the `nprobe` closest lists only. Larger nprobe means better
+recall and slower queries; nprobe == nlist is exact search.
+
+The index is three arrays that live in the chunk index bundle:
+    centroids  float32 [nlist, dim]
+    order      int64   [count]      row ids grouped by list
+    offsets    int64   [nlist + 1]  list i is order[offsets[i]:offsets[i+1]]
+"""
+import os, time
+from typing import Dict, Tuple, Optional
+from loguru import logger
+
+ANN_INDEX    = os.getenv("ANN_INDEX", "none").lower()    # none | ivf
+ANN_MIN_ROWS = int(os.getenv("ANN_MIN_ROWS", "5000"))   # below this exact search is cheap enough
+ANN_NLIST    = int(os.getenv("ANN_NLIST", "0"))         # 0 = ~sqrt(count)
+ANN_NPROBE   = int(os.getenv("ANN_NPROBE", "8"))
+ANN_KMEANS_ITERS = int(os.getenv("ANN_KMEANS_ITERS", "12"))
+
+_TRAIN_PER_LIST = 64     # k-means trains on a sample of nlist * this many rows
+_ASSIGN_BLOCK   = 65536  # rows scored against the centroids at a time
+
+def enabled() -> bool:
+    return ANN_INDEX == "ivf"
+
+# -------------------------
+# Build
+# -------------------------
+def _assign(matrix, centroids):
+    import numpy as np
+
+    out = np.empty(len(matrix), dtype=np.int64)
+    for s in range(0, len(matrix), _ASSIGN_BLOCK):
+        block = np.asarray(matrix[s:s + _ASSIGN_BLOCK], dtype=np.float32)
+        out[s:s + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return out
+
+def _kmeans(sample, nlist: int, iters: int, seed: int):
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+    for _ in range(iters):
+        labels = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        counts = np.bincount(labels, minlength=nlist)
+        empty = counts == 0
+        if empty.any():
+            # Re-seed empty lists from random sample rows.
+            sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()), replace=False)]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = (sums / np.maximum(norms, 1e-8)).astype(np.float32)
+    return centroids
+
+def build_ivf(matrix, nlist: int = ANN_NLIST, iters: int = ANN_KMEANS_ITERS, seed: int = 0) -> Dict:
+    """Return {"centroids", "order", "offsets"} for an [n, dim] unit-row matrix."""
+    import numpy as np
+
+    n = len(matrix)
+    nlist = nlist or max(1, int(round(n ** 0.5)))
+    nlist = max(1, min(nlist, n))
+
+    rng = np.random.default_rng(seed)
+    n_train = min(n, nlist * _TRAIN_PER_LIST)
+    train_rows = np.sort(rng.choice(n, size=n_train, replace=False))
+    sample = np.asarray(matrix[train_rows], dtype=np.float32)
+
+    centroids = _kmeans(sample, nlist, iters, seed)
+    labels = _assign(matrix, centroids)
+    order = np.argsort(labels, kind="stable").astype(np.int64)
+    offsets = np.zeros(nlist + 1, dtype=np.int64)
+    np.cumsum(np.bincount(labels, minlength=nlist), out=offsets[1:])
+    return {"centroids": centroids, "order": order, "offsets": offsets}
+
+# -------------------------
+# Search
+# -------------------------
+def candidates(ivf: Dict, q, nprobe: int = ANN_NPROBE):
+    """Row ids in the nprobe lists closest to q (unit vector)."""
+    import numpy as np
+
+    centroids, order, offsets = ivf["centroids"], ivf["order"], ivf["offsets"]
+    nprobe = max(1, min(nprobe, len(centroids)))
+    cs = centroids @ q
+    lists = np.argpartition(-cs, nprobe - 1)[:nprobe]
+    parts = [order[offsets[i]:offsets[i + 1]] for i in lists]
+    return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+
+def search(matrix, ivf: Dict, q, top_k: int, nprobe: int = ANN_NPROBE) -> Tuple:
+    """(row ids, scores) of the approximate top_k, best first."""
+    import numpy as np
+
+    rows = candidates(ivf, q, nprobe)
+    if len(rows) < top_k:
+        return None, None  # too few candidates; caller falls back to exact
+    rows = np.sort(rows)   # sequential page access on the mapped matrix
+    scores = matrix[rows] @ q
+    k = min(top_k, len(rows))
+    idx = np.argpartition(-scores, k - 1)[:k]
+    idx = idx[np.argsort(-scores[idx], kind="stable")]
+    return rows[idx], scores[idx]
+
+# -------------------------
+# Evaluation
+# -------------------------
+def measure_recall(matrix, ivf: Dict, k: int = 10, nprobe: int = ANN_NPROBE,
+                   n_queries: int = 100, seed: int = 0) -> Optional[float]:
+    """
+    recall@k of IVF search against exact search, using a sample of indexed
+    rows (slightly perturbed) as queries.
+    """
+    import numpy as np
+
+    n = len(matrix)
+    if n == 0:
+        return None
+    k = min(k, n)
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(n, size=min(n_queries, n), replace=False)
+    queries = np.asarray(matrix[np.sort(picks)], dtype=np.float32)
+    queries += rng.normal(scale=0.01, size=queries.shape).astype(np.float32)
+    queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-8)
+
+    hits = 0
+    for q in queries:
+        exact = np.argpartition(-(matrix @ q), k - 1)[:k]
+        approx, _ = search(matrix, ivf, q, k, nprobe)
+        if approx is None:
+            approx = exact
+        hits += len(set(exact.tolist()) & set(approx.tolist()))
+    return hits / float(k * len(queries))
+
+def build_for_ingest(matrix) -> Tuple[Optional[Dict], Optional[Dict]]:
+    """
+    Build an IVF index if ANN_INDEX=ivf and the corpus is large enough.
+    Returns (arrays to persist, meta block) or (None, None).
+    """
+    n = len(matrix)
+    if not enabled() or n < max(1, ANN_MIN_ROWS):
+        return None, None
+    t0 = time.perf_counter()
+    ivf = build_ivf(matrix)
+    build_s = time.perf_counter() - t0
+    recall = measure_recall(matrix, ivf, k=10, nprobe=ANN_NPROBE)
+    meta = {
+        "kind": "ivf",
+        "nlist": int(len(ivf["centroids"])),
+        "nprobe": ANN_NPROBE,
+        "build_s": round(build_s, 3),
+        "recall_at_10": None if recall is None else round(recall, 4),
+    }
+    logger.info(f"Built IVF index: {meta}")
+    return {f"ivf_{k}": v for k, v in ivf.items()}, meta
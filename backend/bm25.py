@@ -0,0 +1,188 @@
+# backend/bm25.py
+"""
+BM25 inverted index over the chunk texts, stored as compact arrays in the
+index bundle:
+
+    bm25_vocab    uint8   UTF-8 terms, sorted, "\n"-separated (term id = position)
+    bm25_vocab_off int64  [V + 1]  term t is vocab[vocab_off[t]:vocab_off[t+1] - 1]
+    bm25_offsets  int64   [V + 1]  postings of term t are [offsets[t], offsets[t+1])
+    bm25_docs     int32   [P]      row ids, ascending within each term
+    bm25_tfs      uint16  [P]      term frequency in that row
+    bm25_doclen   float32 [N]      tokens per row
+
+Scoring needs only the postings of the query terms, so lexical search never
+touches the embedding matrix and needs no embedding call. Terms are looked
+up by binary search over the mapped vocabulary, so processes sharing an
+index share its vocabulary too (indexes written before bm25_vocab_off
+existed decode it into a dict instead).
+"""
+import os, re
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B  = float(os.getenv("BM25_B", "0.75"))
+
+ARRAYS = ("bm25_vocab", "bm25_offsets", "bm25_docs", "bm25_tfs", "bm25_doclen")
+OPTIONAL_ARRAYS = ("bm25_vocab_off",)
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were will with".split()
+)
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN.findall(text.lower()) if t not in _STOPWORDS]
+
+# -------------------------
+# Build
+# -------------------------
+class Builder:
+    """
+    Incremental build: add() row texts batch by batch (rows are numbered in
+    order), then arrays(). Postings are kept as compact NumPy arrays per
+    batch, so the raw texts never need to be held together.
+    """
+    def __init__(self):
+        self._vocab: Dict[str, int] = {}
+        self._terms: List = []
+        self._docs: List = []
+        self._tfs: List = []
+        self._doclen: List = []
+        self._rows = 0
+
+    def add(self, texts: List[str]) -> None:
+        import numpy as np
+
+        term_ids: List[int] = []
+        doc_ids: List[int] = []
+        tfs: List[int] = []
+        doclen = np.zeros(len(texts), dtype=np.float32)
+        for d, text in enumerate(texts):
+            toks = tokenize(text)
+            doclen[d] = len(toks)
+            for term, tf in Counter(toks).items():
+                term_ids.append(self._vocab.setdefault(term, len(self._vocab)))
+                doc_ids.append(self._rows + d)
+                tfs.append(min(tf, 65535))
+        self._terms.append(np.asarray(term_ids, dtype=np.int64))
+        self._docs.append(np.asarray(doc_ids, dtype=np.int32))
+        self._tfs.append(np.asarray(tfs, dtype=np.uint16))
+        self._doclen.append(doclen)
+        self._rows += len(texts)
+
+    def arrays(self) -> Dict:
+        """Arrays (see module docstring) for every row added so far."""
+        import numpy as np
+
+        def cat(parts, dtype):
+            return np.concatenate(parts) if parts else np.zeros(0, dtype=dtype)
+
+        # Renumber terms in sorted order so the vocab blob is sorted too.
+        terms = sorted(self._vocab)
+        remap = np.zeros(len(terms), dtype=np.int64)
+        for new_id, term in enumerate(terms):
+            remap[self._vocab[term]] = new_id
+        tids = remap[cat(self._terms, np.int64)]
+        order = np.argsort(tids, kind="stable")   # keeps row ids ascending per term
+
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(tids, minlength=len(terms)), out=offsets[1:])
+        encoded = [t.encode("utf-8") for t in terms]
+        vocab_off = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum([len(t) + 1 for t in encoded], out=vocab_off[1:])
+        return {
+            "bm25_vocab": np.frombuffer(b"\n".join(encoded), dtype=np.uint8),
+            "bm25_vocab_off": vocab_off,
+            "bm25_offsets": offsets,
+            "bm25_docs": cat(self._docs, np.int32)[order],
+            "bm25_tfs": cat(self._tfs, np.uint16)[order],
+            "bm25_doclen": cat(self._doclen, np.float32),
+        }
+
+def build(texts: List[str]) -> Dict:
+    """Arrays (see module docstring) for the given row texts."""
+    b = Builder()
+    b.add(texts)
+    return b.arrays()
+
+# -------------------------
+# Search
+# -------------------------
+class BM25Index:
+    """Query-side view over the (memory-mapped) arrays of one index."""
+    def __init__(self, arrays: Dict):
+        self._arrays = arrays
+        self._vocab: Optional[Dict[str, int]] = None
+        doclen = arrays["bm25_doclen"]
+        self.n_docs = len(doclen)
+        self.avgdl = float(doclen.mean()) if self.n_docs else 0.0
+
+    @property
+    def vocab(self) -> Dict[str, int]:
+        # Decoded on first lexical query only.
+        if self._vocab is None:
+            blob = bytes(self._arrays["bm25_vocab"]).decode("utf-8")
+            self._vocab = {t: i for i, t in enumerate(blob.split("\n"))} if blob else {}
+        return self._vocab
+
+    def term_id(self, term: str) -> Optional[int]:
+        off = self._arrays.get("bm25_vocab_off")
+        if off is None:
+            return self.vocab.get(term)
+        blob, key = self._arrays["bm25_vocab"], term.encode("utf-8")
+        lo, hi = 0, len(off) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            word = bytes(blob[int(off[mid]):int(off[mid + 1]) - 1])
+            if word < key:
+                lo = mid + 1
+            elif word > key:
+                hi = mid
+            else:
+                return mid
+        return None
+
+    def scores(self, query: str, k1: float = BM25_K1, b: float = BM25_B):
+        """(row ids, scores) of every row matching at least one query term."""
+        import numpy as np
+
+        offsets = self._arrays["bm25_offsets"]
+        docs_all, tfs_all = self._arrays["bm25_docs"], self._arrays["bm25_tfs"]
+        doclen = self._arrays["bm25_doclen"]
+        rows, contrib = [], []
+        for term, qtf in Counter(tokenize(query)).items():
+            t = self.term_id(term)
+            if t is None:
+                continue
+            lo, hi = int(offsets[t]), int(offsets[t + 1])
+            df = hi - lo
+            idf = np.log(1.0 + (self.n_docs - df + 0.5) / (df + 0.5))
+            docs = np.asarray(docs_all[lo:hi], dtype=np.int64)
+            tf = np.asarray(tfs_all[lo:hi], dtype=np.float32)
+            norm = k1 * (1.0 - b + b * doclen[docs] / max(self.avgdl, 1e-6))
+            rows.append(docs)
+            contrib.append(qtf * idf * tf * (k1 + 1.0) / (tf + norm))
+        if not rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        uniq, inv = np.unique(np.concatenate(rows), return_inverse=True)
+        return uniq, np.bincount(inv, weights=np.concatenate(contrib)).astype(np.float32)
+
+    def top_k(self, query: str, top_k: int) -> Tuple:
+        import numpy as np
+
+        rows, scores = self.scores(query)
+        if not len(rows) or top_k <= 0:
+            return rows[:0], scores[:0]
+        k = min(top_k, len(rows))
+        idx = np.argpartition(-scores, k - 1)[:k]
+        idx = idx[np.argsort(-scores[idx], kind="stable")]
+        return rows[idx], scores[idx]
+
+def rrf(rankings: List, top_k: int, k: int = 60) -> List[Tuple[int, float]]:
+    """Reciprocal rank fusion of several best-first row-id lists."""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking):
+            fused[int(row)] = fused.get(int(row), 0.0) + 1.0 / (k + rank + 1)
+    return sorted(fused.items(), key=lambda x: -x[1])[:top_k]
@@ -0,0 +1,207 @@
+# backend/caching.py
+"""
+Small caches shared by the search and generation paths: an in-process LRU
+with TTL, and an optional SQLite-backed store for entries worth keeping
+across restarts.
+"""
+import os, json, time, sqlite3, threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+_MISSING = object()
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with a per-entry time-to-live.
+
+    `maxsize` bounds the number of entries (least recently used goes first);
+    entries older than `ttl` seconds are treated as misses (ttl <= 0: never
+    expire). Hit/miss/eviction counters are kept for stats().
+    """
+    def __init__(self, maxsize: int = 1024, ttl: float = 0.0, name: str = "cache"):
+        self.maxsize = max(0, int(maxsize))
+        self.ttl = float(ttl)
+        self.name = name
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expired = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                self.misses += 1
+                return default
+            stored_at, value = item
+            if self.ttl > 0 and now - stored_at > self.ttl:
+                del self._data[key]
+                self.expired += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if self.maxsize == 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "name": self.name,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_s": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "expired": self.expired,
+            }
+
+class SemanticCache:
+    """
+    LRU of answers keyed by query embedding rather than query text.
+
+    lookup() returns the entry whose query vector has the highest cosine
+    similarity to the given one, provided it is at least `threshold` and the
+    entry has the same `scope` (e.g. index version plus cited chunks). At
+    most `maxsize` entries are kept; the scan is a single matrix-vector
+    product over the entries of that scope.
+    """
+    def __init__(self, maxsize: int = 1024, threshold: float = 0.95, name: str = "semantic"):
+        self.maxsize = max(0, int(maxsize))
+        self.threshold = float(threshold)
+        self.name = name
+        self._data: "OrderedDict[int, tuple]" = OrderedDict()   # id -> (scope, unit vector, query, value)
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    @staticmethod
+    def _unit(vec):
+        import numpy as np
+
+        v = np.asarray(vec, dtype=np.float32).ravel()
+        return v / max(float(np.linalg.norm(v)), 1e-8)
+
+    def lookup(self, vec, scope: Hashable) -> Optional[Tuple[Any, float, str]]:
+        """(value, similarity, cached query) of the best match, or None."""
+        import numpy as np
+
+        q = self._unit(vec)
+        with self._lock:
+            cands = [(i, e) for i, e in self._data.items() if e[0] == scope and e[1].shape == q.shape]
+            if cands:
+                sims = np.stack([e[1] for _, e in cands]) @ q
+                best = int(np.argmax(sims))
+                if sims[best] >= self.threshold:
+                    entry_id, (_, _, query, value) = cands[best]
+                    self._data.move_to_end(entry_id)
+                    self.hits += 1
+                    return value, float(sims[best]), query
+            self.misses += 1
+            return None
+
+    def store(self, vec, scope: Hashable, query: str, value: Any) -> None:
+        if self.maxsize == 0:
+            return
+        q = self._unit(vec)
+        with self._lock:
+            self._data[self._next_id] = (scope, q, query, value)
+            self._next_id += 1
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "name": self.name,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+            }
+
+class DiskStore:
+    """
+    Size-bounded JSON key/value table in SQLite, tagged with a version.
+
+    Entries carry the version they were computed against; purge(version)
+    drops every entry of any other version. When more than `maxsize`
+    entries are stored, the oldest are deleted.
+    """
+    def __init__(self, path: str, table: str, maxsize: int = 1024):
+        self.path = path
+        self.table = table
+        self.maxsize = max(1, int(maxsize))
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            " key TEXT PRIMARY KEY, version TEXT NOT NULL, value TEXT NOT NULL, stored_at REAL NOT NULL)"
+        )
+        return conn
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            conn = self._connect()
+            try:
+                row = conn.execute(f"SELECT value FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            finally:
+                conn.close()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, value: Any, version: Any) -> None:
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute(f"INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?, ?)",
+                                 (key, str(version), json.dumps(value), time.time()))
+                    conn.execute(
+                        f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM {self.table}"
+                        " ORDER BY stored_at DESC LIMIT -1 OFFSET ?)", (self.maxsize,))
+            finally:
+                conn.close()
+
+    def purge(self, keep_version: Any) -> int:
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    cur = conn.execute(f"DELETE FROM {self.table} WHERE version != ?", (str(keep_version),))
+                return cur.rowcount
+            finally:
+                conn.close()
@@ -0,0 +1,137 @@
+# backend/context.py
+"""
+Prompt context from search hits: consecutive chunks of the same source are
+merged into one span with their shared overlap removed, then spans are
+packed best-first into a token budget.
+
+Each span is labelled with its citation, `[file#3]` for a single chunk or
+`[file#3-5]` for a merged run, so the labels the model sees always name
+exactly the chunks whose text follows. Token counts use the same ~4 chars
+per token estimate as the embedding batcher.
+"""
+import os
+from typing import Dict, List, Optional
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+
+_MIN_OVERLAP = 16   # shorter suffix/prefix matches are treated as coincidence
+_SEP = "\n\n"
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+def _overlap(a: str, b: str) -> int:
+    """Length of the longest suffix of `a` that is a prefix of `b` (0 if short)."""
+    probe = b[:_MIN_OVERLAP]
+    if len(probe) < _MIN_OVERLAP:
+        return 0
+    i = a.find(probe, max(0, len(a) - len(b)))
+    while i != -1:
+        if b.startswith(a[i:]):
+            return len(a) - i
+        i = a.find(probe, i + 1)
+    return 0
+
+def _join(a: str, b: str) -> str:
+    k = _overlap(a, b)
+    return a + b[k:] if k else a + " " + b
+
+class Span:
+    """A run of consecutive chunks from one source, as one block of text."""
+    def __init__(self, source_path: str, chunks: List[int], text: str, rank: int):
+        self.source_path = source_path
+        self.chunks = chunks
+        self.text = text
+        self.rank = rank     # best search rank among its chunks
+
+    @property
+    def ref(self) -> str:
+        lo, hi = self.chunks[0], self.chunks[-1]
+        return f"{self.source_path}#{lo}" if lo == hi else f"{self.source_path}#{lo}-{hi}"
+
+    @property
+    def block(self) -> str:
+        return f"[{self.ref}] {self.text}"
+
+def merge_spans(results: List[Dict]) -> List[Span]:
+    """Group hits into spans, ordered by their best rank. Duplicate hits are dropped."""
+    best: Dict[tuple, tuple] = {}
+    for rank, r in enumerate(results):
+        key = (r["source_path"], int(r["chunk_index"]))
+        if key not in best:
+            best[key] = (rank, r["text"])
+
+    spans: List[Span] = []
+    for (src, idx), (rank, text) in sorted(best.items()):
+        last = spans[-1] if spans else None
+        if last is not None and last.source_path == src and last.chunks[-1] == idx - 1:
+            last.chunks.append(idx)
+            last.text = _join(last.text, text)
+            last.rank = min(last.rank, rank)
+        else:
+            spans.append(Span(src, [idx], text, rank))
+    return sorted(spans, key=lambda s: s.rank)
+
+class PackedContext:
+    def __init__(self, spans: List[Span], dropped: List[str], budget: int, raw_tokens: int):
+        self.spans = spans
+        self.dropped = dropped
+        self.budget = budget
+        self.raw_tokens = raw_tokens     # what joining every hit verbatim would have cost
+        self.text = _SEP.join(s.block for s in spans)
+        self.tokens = estimate_tokens(self.text) if spans else 0
+
+    def citations(self) -> List[Dict]:
+        """One entry per chunk that made it into the context, in context order."""
+        return [{"source": s.source_path, "chunk": c, "ref": f"{s.source_path}#{c}"}
+                for s in self.spans for c in s.chunks]
+
+    def info(self) -> Dict:
+        return {
+            "tokens": self.tokens,
+            "budget": self.budget,
+            "raw_tokens": self.raw_tokens,
+            "spans": [s.ref for s in self.spans],
+            "dropped": self.dropped,
+        }
+
+def pack(results: List[Dict], budget: Optional[int] = None) -> PackedContext:
+    """
+    Merge `results` (best first) into spans and keep as many as fit in
+    `budget` tokens, best first. A span that does not fit is retried as its
+    best-ranked chunk alone; if not even the top hit fits, it is truncated
+    so the context is never empty when there were hits.
+    """
+    budget = CONTEXT_TOKEN_BUDGET if budget is None else budget
+    raw_tokens = sum(estimate_tokens(f"[{r['source_path']}#{r['chunk_index']}] {r['text']}") for r in results)
+    sep_tokens = len(_SEP) / 4
+
+    kept: List[Span] = []
+    dropped: List[str] = []
+    used = 0.0
+    for span in merge_spans(results):
+        cost = len(span.block) / 4 + (sep_tokens if kept else 0)
+        if used + cost <= budget:
+            kept.append(span)
+            used += cost
+            continue
+        if len(span.chunks) > 1:
+            top = results[span.rank]
+            single = Span(span.source_path, [int(top["chunk_index"])], top["text"], span.rank)
+            cost = len(single.block) / 4 + (sep_tokens if kept else 0)
+            if used + cost <= budget:
+                kept.append(single)
+                used += cost
+                dropped.extend(f"{span.source_path}#{c}" for c in span.chunks if c != single.chunks[0])
+                continue
+        dropped.extend(f"{span.source_path}#{c}" for c in span.chunks)
+
+    if not kept and results:
+        top = results[0]
+        single = Span(top["source_path"], [int(top["chunk_index"])], "", 0)
+        room = max(0, budget * 4 - len(single.block))
+        single.text = top["text"][:room]
+        kept.append(single)
+        dropped = [d for d in dropped if d != single.ref]
+
+    return PackedContext(kept, dropped, budget, raw_tokens)
@@ -0,0 +1,68 @@
+# backend/embed_cache.py
+"""
+Persistent embedding cache keyed by (sha256(chunk text), embed model).
+
+Lives in a small SQLite file next to the index so it survives re-ingests and
+restarts; vectors are stored as raw float32 blobs. Re-ingesting a corpus in
+which only a few chunks changed then only pays for those chunks.
+"""
+import os, hashlib, sqlite3, threading
+from typing import Dict, List, Iterable, Tuple
+
+CACHE_PATH = os.getenv(
+    "EMBED_CACHE_PATH",
+    os.path.join(os.getenv("DATA_DIR", os.path.join(os.path.dirname(__file__), "data")), "embed_cache.sqlite"),
+)
+_BATCH = 500  # SQLite parameter limit friendly
+_lock = threading.Lock()
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def _connect() -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(CACHE_PATH), exist_ok=True)
+    conn = sqlite3.connect(CACHE_PATH, timeout=30)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS embeddings ("
+        " text_hash TEXT NOT NULL, model TEXT NOT NULL, vec BLOB NOT NULL,"
+        " PRIMARY KEY (text_hash, model))"
+    )
+    return conn
+
+def get_many(hashes: Iterable[str], model: str) -> Dict[str, List[float]]:
+    """Cached vectors for the given text hashes (missing ones are absent)."""
+    import numpy as np
+
+    keys = list(dict.fromkeys(hashes))
+    out: Dict[str, List[float]] = {}
+    if not keys:
+        return out
+    with _lock:
+        conn = _connect()
+        try:
+            for s in range(0, len(keys), _BATCH):
+                part = keys[s:s + _BATCH]
+                marks = ",".join("?" * len(part))
+                rows = conn.execute(
+                    f"SELECT text_hash, vec FROM embeddings WHERE model = ? AND text_hash IN ({marks})",
+                    [model, *part],
+                )
+                for h, blob in rows:
+                    out[h] = np.frombuffer(blob, dtype="<f4").tolist()
+        finally:
+            conn.close()
+    return out
+
+def put_many(items: Iterable[Tuple[str, List[float]]], model: str) -> None:
+    import numpy as np
+
+    rows = [(h, model, np.asarray(v, dtype="<f4").tobytes()) for h, v in items]
+    if not rows:
+        return
+    with _lock:
+        conn = _connect()
+        try:
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", rows)
+        finally:
+            conn.close()
@@ -1,8 +1,65 @@
 # backend/generation.py
-import os, random, hashlib, json
-from typing import List
+import os, random, hashlib, json, threading
+from typing import List, Optional
+import anyio
+from loguru import logger
 from schemas import Question, GenerateQuery
-from search import search_chunks  # used by generate_with_openai
+from search import search_chunks, get_index  # used by generate_with_openai
+from caching import TTLCache, DiskStore
+from question_bank import FALLBACK_BANK
+import context
+import llm
+
+# -------------------------
+# Survey cache
+# -------------------------
+# Generated surveys keyed by (role, count, seed, index version, model).
+# GENERATE_CACHE_PATH (a SQLite file) keeps them across restarts; entries
+# for older index versions are dropped as soon as a new version is seen.
+GENERATE_CACHE_SIZE = int(os.getenv("GENERATE_CACHE_SIZE", "512"))
+GENERATE_CACHE_PATH = os.getenv("GENERATE_CACHE_PATH", "")
+
+SURVEYS = TTLCache(maxsize=GENERATE_CACHE_SIZE, ttl=0, name="generate_surveys")
+_SURVEYS_DISK = DiskStore(GENERATE_CACHE_PATH, "surveys", GENERATE_CACHE_SIZE) if GENERATE_CACHE_PATH else None
+_cache_version: Optional[str] = None
+_cache_lock = threading.Lock()
+
+def _survey_key(q: GenerateQuery, version: str) -> tuple:
+    return (q.role, q.count, q.seed, version, llm.OPENAI_MODEL)
+
+def _invalidate_stale(version: str) -> None:
+    """Drop surveys built against an older index version."""
+    global _cache_version
+    with _cache_lock:
+        if _cache_version == version:
+            return
+        _cache_version = version
+        SURVEYS.clear()
+    if _SURVEYS_DISK is not None:
+        dropped = _SURVEYS_DISK.purge(version)
+        if dropped:
+            logger.info(f"Dropped {dropped} cached surveys from older index versions")
+
+def _cached_survey(key: tuple) -> Optional[List[Question]]:
+    hit = SURVEYS.get(key)
+    if hit is None and _SURVEYS_DISK is not None:
+        hit = _SURVEYS_DISK.get(json.dumps(key))
+        if hit is not None:
+            SURVEYS.set(key, hit)
+    return [Question(**x) for x in hit] if hit is not None else None
+
+def _lookup_survey(q: GenerateQuery) -> tuple:
+    """(cache key, cached survey or None) against the current index version."""
+    version = get_index().version
+    _invalidate_stale(version)
+    key = _survey_key(q, version)
+    return key, _cached_survey(key)
+
+def _store_survey(key: tuple, questions: List[Question]) -> None:
+    value = [x.model_dump() for x in questions]
+    SURVEYS.set(key, value)
+    if _SURVEYS_DISK is not None:
+        _SURVEYS_DISK.set(json.dumps(key), value, key[3])
 
 def _id(seed_text: str) -> str:
     return "q_" + hashlib.md5(seed_text.encode()).hexdigest()[:8]
@@ -12,18 +69,7 @@ def _fallback_questions(q: GenerateQuery) -> List[Question]:
     Deterministic, role-aware fallback. Ensures 10–15 questions, mostly MCQ/Likert
     and includes one short_text at the end.
     """
-    base = [
-        ("Which challenges apply today?", ["Stockouts", "Overstock", "Slow turns", "Supplier delays", "Data silos"], True),
-        ("What best describes your inventory process?", ["Manual spreadsheets", "Basic POS", "ERP-lite", "Full ERP (APIs)"], False),
-        ("Which channels do you sell on?", ["Offline retail", "Own website", "Marketplaces", "Social commerce", "B2B"], True),
-        ("Your current demand forecasting maturity?", ["None", "Simple moving avg", "Seasonality aware", "ML models"], False),
-        ("Which integrations do you already use?", ["Tally/Zoho", "Shopify", "Woo", "SAP/Oracle", "Custom DB"], True),
-        ("Supplier reliability (OTD) meets targets.", None, False),
-        ("We can trace inventory at batch/lot level.", None, False),
-        ("Our lead-time variability is under control.", None, False),
-        ("We have ABC/XYZ classification live.", None, False),
-        ("Replenishment is automated for top SKUs.", None, False),
-    ]
+    base = list(FALLBACK_BANK)
     rnd = random.Random(q.seed or 42)
     rnd.shuffle(base)
 
@@ -56,17 +102,23 @@ def _fallback_questions(q: GenerateQuery) -> List[Question]:
 
     return out
 
-def generate_with_openai(q: GenerateQuery) -> List[Question]:
+async def generate_with_openai(q: GenerateQuery) -> List[Question]:
     """
     Generates survey questions with OpenAI, grounded in GSOS chunks (JSON).
     Types allowed: mcq | likert | short_text. Includes multi for MCQ.
+    Retrieval runs in a worker thread; the completion runs on the shared
+    async client. Successful surveys are cached per index version; the
+    fallback is never cached. Cache I/O (SQLite when GENERATE_CACHE_PATH is
+    set) and index loading also run in worker threads.
     """
-    from openai import OpenAI
+    key, cached = await anyio.to_thread.run_sync(_lookup_survey, q)
+    if cached is not None:
+        return cached
 
     # Build context from chunks relevant to this role
     query = f"GSOS readiness and operational considerations for role={q.role}"
-    top, _ = search_chunks(query, top_k=max(6, q.count))
-    context = "\n\n".join([f"[{t['source_path']}#{t['chunk_index']}] {t['text']}" for t in top]) or "No context."
+    top, _ = await anyio.to_thread.run_sync(search_chunks, query, max(6, q.count))
+    ctx = context.pack(top).text or "No context."
 
     sys = (
         "You are an expert survey designer for GSOS TATHAASTU. "
@@ -75,20 +127,18 @@ def generate_with_openai(q: GenerateQuery) -> List[Question]:
         "Types allowed: mcq, likert, short_text. MCQs have 3–6 concise options; Likert is 1–5. "
         "Include at least one short_text. Avoid duplicates and keep prompts specific."
     )
-    user = f"role={q.role}; count={q.count}\nContext:\n{context}"
+    user = f"role={q.role}; count={q.count}\nContext:\n{ctx}"
 
     try:
-        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        rsp = client.chat.completions.create(
-            model=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
-            temperature=0.2,
-            messages=[
+        content = await llm.chat(
+            [
                 {"role": "system", "content": sys},
                 {"role": "user", "content": user},
             ],
+            temperature=0.2,
             response_format={"type": "json_object"},
         )
-        data = json.loads(rsp.choices[0].message.content)
+        data = json.loads(content)
         # Validate and coerce minimal fields
         out: List[Question] = []
         for x in data.get("questions", []):
@@ -110,7 +160,9 @@ def generate_with_openai(q: GenerateQuery) -> List[Question]:
                                 prompt="Briefly describe your biggest process gap to reach 2× scale."))
         if len(out) < 10:
             out.extend(_fallback_questions(GenerateQuery(role=q.role, count=10 - len(out), seed=q.seed)))
-        return out[:15]
+        out = out[:15]
+        await anyio.to_thread.run_sync(_store_survey, key, out)
+        return out
     except Exception:
         # Keep the API reliable with fallback
         return _fallback_questions(q)
@@ -0,0 +1,448 @@
+# backend/index_store.py
+"""
+On-disk chunk index format.
+
+An index is a small JSON header plus raw sidecar files next to it, all
+sharing one generation id <gen>:
+
+    gsos_chunks.idx.json          header: {"format", "generation", "meta", "arrays", "records"}
+    gsos_chunks.<gen>.emb         float32 [count, dim] embeddings, rows unit-normalised
+    gsos_chunks.<gen>.emb.f16 / .emb.q8 + .emb.scale
+                                  optional compressed copy that queries scan (see vectors.py)
+    gsos_chunks.<gen>.rec.jsonl   one {"source_path", "chunk_index", "text"} per line
+    gsos_chunks.<gen>.rec.off     uint64 [count + 1] byte offsets into rec.jsonl
+    gsos_chunks.<gen>.ivf.*       optional ANN arrays (see ann.py)
+
+Arrays are raw little-endian buffers described by the header (file, dtype,
+shape) and are opened with np.memmap, so loading an index parses only the
+header and later touches only the pages a query actually reads.
+
+Writes never touch a live generation: sidecars go to fresh names (rows can
+be appended batch by batch with IndexWriter), are fsynced, and the header is
+then swapped in with an atomic rename. Readers
+see either the old index or the new one, never a mix. Files from older
+generations are pruned afterwards (the previous one is kept for readers that
+read the old header a moment before the swap).
+
+Several processes (uvicorn workers) can serve one index: every array is a
+read-only shared mapping, so the page cache holds a single copy. Two small
+files coordinate them:
+
+    gsos_chunks.idx.gen           uint64 commit counter, mapped by every reader
+    gsos_chunks.idx.lock          flock()ed by the one process writing an index
+"""
+import os, json, time, mmap, contextlib, threading
+from typing import Dict, List, Optional, Iterator
+from loguru import logger
+import vectors
+
+try:
+    import fcntl
+except ImportError:      # non-POSIX: single-process use only
+    fcntl = None
+
+FORMAT = "gsos-index/1"
+
+# -------------------------
+# Paths
+# -------------------------
+def header_path(base: str) -> str:
+    return base + ".idx.json"
+
+def _sidecar(base: str, gen: str, suffix: str) -> str:
+    return f"{base}.{gen}.{suffix}"
+
+def _new_generation() -> str:
+    return f"{time.time_ns():x}"
+
+def _counter_path(base: str) -> str:
+    return base + ".idx.gen"
+
+def _lock_path(base: str) -> str:
+    return base + ".idx.lock"
+
+def _fsync_replace(tmp: str, dest: str) -> None:
+    os.replace(tmp, dest)
+    try:
+        fd = os.open(os.path.dirname(dest) or ".", os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+# -------------------------
+# Writing
+# -------------------------
+def _write_array(base: str, gen: str, suffix: str, arr) -> Dict:
+    import numpy as np
+
+    arr = np.asarray(arr)
+    arr = np.ascontiguousarray(arr, dtype=arr.dtype.newbyteorder("<"))
+    dest = _sidecar(base, gen, suffix)
+    with open(dest, "wb") as f:
+        f.write(arr.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    return {"file": os.path.basename(dest), "dtype": arr.dtype.str, "shape": list(arr.shape)}
+
+def _referenced_files(header: Optional[Dict]) -> List[str]:
+    if not header:
+        return []
+    names = [desc["file"] for desc in (header.get("arrays") or {}).values()]
+    rec = header.get("records")
+    if rec:
+        names += [rec["file"], rec["offsets"]["file"]]
+    return names
+
+def _prune(base: str, keep: List[str]) -> None:
+    """Delete sidecars of generations other than the ones in `keep`."""
+    d, prefix = os.path.dirname(base), os.path.basename(base) + "."
+    keep_set = set(keep)
+    for name in os.listdir(d):
+        if (not name.startswith(prefix) or name in keep_set or name.startswith(prefix + "idx.")
+                or name.endswith(".json") or name.endswith(".tmp")):
+            continue
+        try:
+            os.remove(os.path.join(d, name))
+        except OSError as e:
+            logger.warning(f"Could not prune stale index file {name}: {e}")
+
+def normalize_rows(embeddings, count: int):
+    """[count, dim] float32 matrix with unit-length rows."""
+    import numpy as np
+
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    if matrix.size == 0:
+        return np.zeros((count, 0), dtype=np.float32)
+    if matrix.ndim != 2:
+        matrix = matrix.reshape(count, -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-8)
+
+class IndexWriter:
+    """
+    Builds one new generation incrementally: append() record batches with
+    their embeddings, add_array() any extra arrays, then commit() swaps the
+    header in. Nothing is visible to readers until commit(); abort() removes
+    the partial sidecars. Memory use is bounded by the batch size.
+
+    With a compressed `storage` (float16 / int8, default EMBED_STORAGE) each
+    batch is also encoded into the compressed row arrays as it is appended.
+    """
+    def __init__(self, base: str, storage: Optional[str] = None):
+        os.makedirs(os.path.dirname(base), exist_ok=True)
+        self.base = base
+        self.gen = _new_generation()
+        self.storage = vectors.storage_kind(storage)
+        self.count = 0
+        self.dim: Optional[int] = None
+        self._paths = {k: _sidecar(base, self.gen, k) for k in ("emb", "rec.jsonl", "rec.off")}
+        self._emb = open(self._paths["emb"], "wb")
+        self._rec = open(self._paths["rec.jsonl"], "wb")
+        self._off = open(self._paths["rec.off"], "wb")
+        self._off.write((0).to_bytes(8, "little"))
+        self._pos = 0
+        self._arrays: Dict[str, Dict] = {}
+        self._row_files: Dict[str, object] = {}     # compressed row arrays: name -> open file
+        self._row_desc: Dict[str, Dict] = {}        # name -> {"file", "dtype", "shape"[1:]}
+
+    def append(self, records: List[Dict], embeddings) -> None:
+        """Append rows; embeddings are normalised here, like write_index does."""
+        import numpy as np
+
+        matrix = normalize_rows(embeddings, len(records))
+        dim = int(matrix.shape[1])
+        if self.dim is None or self.count == 0:
+            self.dim = dim
+        elif dim != self.dim:
+            raise ValueError(f"embedding dim changed mid-index: {dim} != {self.dim}")
+        self._emb.write(np.ascontiguousarray(matrix, dtype="<f4").tobytes())
+        for name, arr in vectors.encode(matrix, self.storage).items():
+            arr = np.ascontiguousarray(arr, dtype=arr.dtype.newbyteorder("<"))
+            if name not in self._row_files:
+                path = _sidecar(self.base, self.gen, name.replace("_", "."))
+                self._paths[name] = path
+                self._row_files[name] = open(path, "wb")
+                self._row_desc[name] = {"file": os.path.basename(path), "dtype": arr.dtype.str,
+                                        "shape": list(arr.shape[1:])}
+            self._row_files[name].write(arr.tobytes())
+
+        offsets = np.empty(len(records), dtype="<u8")
+        for i, r in enumerate(records):
+            line = (json.dumps(r, ensure_ascii=False) + "\n").encode("utf-8")
+            self._rec.write(line)
+            self._pos += len(line)
+            offsets[i] = self._pos
+        self._off.write(offsets.tobytes())
+        self.count += len(records)
+
+    def embeddings(self):
+        """Read-only map of the rows appended so far (e.g. to build the ANN index)."""
+        import numpy as np
+
+        self._emb.flush()
+        if not self.count or not self.dim:
+            return np.zeros((self.count, self.dim or 0), dtype=np.float32)
+        return np.memmap(self._paths["emb"], dtype="<f4", mode="r", shape=(self.count, self.dim))
+
+    def _row_array(self, name: str):
+        desc = self._row_desc[name]
+        self._row_files[name].flush()
+        return map_array(self.base, {**desc, "shape": [self.count] + desc["shape"]})
+
+    def view(self, keep_float32: bool = True) -> vectors.Vectors:
+        """The scanned rows appended so far, as readers of this generation will see them."""
+        exact = self.embeddings()
+        if self.storage == "float32" or not self._row_desc:
+            return vectors.Vectors("float32", exact)
+        if self.storage == "float16":
+            return vectors.Vectors("float16", self._row_array("emb_f16"), exact=exact if keep_float32 else None)
+        return vectors.Vectors("int8", self._row_array("emb_q8"), self._row_array("emb_scale"),
+                               exact=exact if keep_float32 else None)
+
+    def add_array(self, name: str, arr) -> None:
+        self._arrays[name] = _write_array(self.base, self.gen, name.replace("_", "."), arr)
+
+    def _files(self) -> List:
+        return [self._emb, self._rec, self._off] + list(self._row_files.values())
+
+    def _close(self) -> None:
+        for f in self._files():
+            if not f.closed:
+                f.flush()
+                os.fsync(f.fileno())
+                f.close()
+
+    def commit(self, meta: Dict, keep_float32: bool = True) -> Dict:
+        """
+        Make this generation the live index. Returns the header. With
+        compressed storage and keep_float32=False the float32 rows are left
+        out (and pruned), so only the compressed copy remains.
+        """
+        self._close()
+        name = lambda k: os.path.basename(self._paths[k])
+        arrays = {k: {**d, "shape": [self.count] + d["shape"]} for k, d in self._row_desc.items()}
+        if keep_float32 or not arrays:
+            arrays["embeddings"] = {"file": name("emb"), "dtype": "<f4", "shape": [self.count, self.dim or 0]}
+        header = {
+            "format": FORMAT,
+            "generation": self.gen,
+            "meta": meta,
+            "arrays": {**arrays, **self._arrays},
+            "records": {
+                "file": name("rec.jsonl"),
+                "offsets": {"file": name("rec.off"), "dtype": "<u8", "shape": [self.count + 1]},
+            },
+        }
+        return _commit_header(self.base, header)
+
+    def abort(self) -> None:
+        for f in self._files():
+            f.close()
+        d = os.path.dirname(self.base)
+        for path in list(self._paths.values()) + [os.path.join(d, a["file"]) for a in self._arrays.values()]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+def write_index(base: str, meta: Dict, records: List[Dict], embeddings,
+                extra_arrays: Optional[Dict] = None) -> Dict:
+    """
+    Write records (without embeddings), an [n, dim] embedding matrix and any
+    extra named arrays (e.g. the ANN index) in one go. Rows are normalised
+    here so readers can use the mapped matrix directly. Returns the header.
+    """
+    writer = IndexWriter(base)
+    try:
+        writer.append(records, embeddings)
+        for name, arr in (extra_arrays or {}).items():
+            writer.add_array(name, arr)
+        return writer.commit(meta)
+    except BaseException:
+        writer.abort()
+        raise
+
+def _commit_header(base: str, header: Dict) -> Dict:
+    """Atomically swap `header` in, then prune generations older than the previous one."""
+    previous = read_header(base)
+    dest = header_path(base)
+    tmp = dest + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(header, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    _fsync_replace(tmp, dest)
+    GenerationCounter(base).bump()
+    _prune(base, _referenced_files(header) + _referenced_files(previous))
+    return header
+
+# -------------------------
+# Cross-process coordination
+# -------------------------
+_writer_rlock = threading.RLock()
+_writer_fds: Dict[str, List[int]] = {}    # base -> [fd, depth] while held by this process
+
+@contextlib.contextmanager
+def writer_lock(base: str):
+    """
+    Exclusive, cross-process lock for building an index under `base`, so two
+    workers never ingest at once (and one never prunes the other's files).
+    Blocks until the lock is free; re-entrant within a thread.
+    """
+    with _writer_rlock:
+        held = _writer_fds.get(base)
+        if held is None:
+            os.makedirs(os.path.dirname(base), exist_ok=True)
+            fd = os.open(_lock_path(base), os.O_RDWR | os.O_CREAT, 0o644)
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            held = _writer_fds[base] = [fd, 0]
+        held[1] += 1
+        try:
+            yield
+        finally:
+            held[1] -= 1
+            if not held[1]:
+                del _writer_fds[base]
+                os.close(held[0])     # releases the flock
+
+class GenerationCounter:
+    """
+    Commit counter in a shared 8-byte file. Writers bump it after each header
+    swap; readers keep it mapped, so noticing a new index (committed by any
+    process) costs one memory read instead of a stat() per query.
+    """
+    def __init__(self, base: str):
+        self.path = _counter_path(base)
+        self._mm: Optional[mmap.mmap] = None
+
+    def _ensure(self) -> None:
+        with open(self.path, "ab") as f:
+            if f.tell() < 8:
+                f.write(b"\0" * (8 - f.tell()))
+
+    def value(self) -> int:
+        """Current count; 0 while no index has been committed."""
+        if self._mm is None:
+            if not os.path.isdir(os.path.dirname(self.path) or "."):
+                return 0
+            self._ensure()     # indexes written before the counter existed get one here
+            with open(self.path, "rb") as f:
+                self._mm = mmap.mmap(f.fileno(), 8, access=mmap.ACCESS_READ)
+        return int.from_bytes(self._mm[:8], "little")
+
+    def bump(self) -> int:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._ensure()
+        fd = os.open(self.path, os.O_RDWR)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            value = int.from_bytes(os.read(fd, 8), "little") + 1
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.write(fd, value.to_bytes(8, "little"))
+            return value
+        finally:
+            os.close(fd)
+
+# -------------------------
+# Reading
+# -------------------------
+def read_header(base: str) -> Optional[Dict]:
+    try:
+        with open(header_path(base), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def map_array(base: str, desc: Dict):
+    """Memory-map one array described in the header (read-only)."""
+    import numpy as np
+
+    shape = tuple(desc["shape"])
+    dtype = np.dtype(desc["dtype"])
+    if not shape or 0 in shape:
+        return np.zeros(shape, dtype=dtype)
+    path = os.path.join(os.path.dirname(base), desc["file"])
+    return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+
+class RecordStore:
+    """
+    Lazy, read-only access to the records sidecar. Each record is parsed
+    from the mapped file only when it is asked for.
+    """
+    def __init__(self, base: str, desc: Optional[Dict]):
+        self._mm = None
+        self._offsets = None
+        if not desc:
+            return
+        self._offsets = map_array(base, desc["offsets"])
+        path = os.path.join(os.path.dirname(base), desc["file"])
+        if len(self) and os.path.getsize(path):
+            with open(path, "rb") as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return 0 if self._offsets is None else max(0, len(self._offsets) - 1)
+
+    def __getitem__(self, i: int) -> Dict:
+        i = int(i)
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        return json.loads(self._mm[start:end])
+
+    def __iter__(self) -> Iterator[Dict]:
+        for i in range(len(self)):
+            yield self[i]
+
+def bundle_files(base: str) -> List[str]:
+    """Absolute paths of the header and every sidecar it references."""
+    header = read_header(base)
+    if header is None:
+        return []
+    d = os.path.dirname(base)
+    return [header_path(base)] + [os.path.join(d, n) for n in _referenced_files(header)]
+
+# -------------------------
+# Legacy JSON migration
+# -------------------------
+def convert_legacy_json(json_path: str, base: str) -> Optional[Dict]:
+    """
+    Convert a pretty-printed {"meta", "records": [{..., "embedding"}]} index
+    into the binary format. Rows whose embedding is malformed or disagrees
+    with the majority dimension are dropped.
+    """
+    if not os.path.exists(json_path):
+        return None
+    t0 = time.perf_counter()
+    with open(json_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    raw = data.get("records", []) or []
+    meta = dict(data.get("meta", {}) or {})
+
+    dims: Dict[int, int] = {}
+    for r in raw:
+        emb = r.get("embedding")
+        if isinstance(emb, list) and emb:
+            dims[len(emb)] = dims.get(len(emb), 0) + 1
+    dim = max(dims, key=dims.get) if dims else 0
+    keep = [r for r in raw if isinstance(r.get("embedding"), list) and len(r["embedding"]) == dim]
+    if len(keep) < len(raw):
+        logger.warning(f"Legacy index has {len(raw) - len(keep)} malformed or mismatched rows; dropped")
+
+    records = [{k: v for k, v in r.items() if k != "embedding"} for r in keep]
+    embeddings = [r["embedding"] for r in keep]
+    meta["count"] = len(records)
+    meta["converted_from"] = os.path.basename(json_path)
+
+    header = write_index(base, meta, records, embeddings)
+    logger.info(f"Converted legacy index {json_path} ({len(records)} rows) in {time.perf_counter() - t0:.2f}s")
+    return header
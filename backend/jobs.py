@@ -0,0 +1,125 @@
+# backend/jobs.py
+"""
+Background ingestion jobs.
+
+Ingestion runs on a dedicated worker thread instead of inside the HTTP
+request. It is single-flight: at most one job runs at a time, and at most one
+more waits behind it. Further submissions while a job is queued coalesce into
+that queued job, which then re-ingests everything incrementally, so uploads
+that land during a run are still picked up.
+"""
+import time, uuid, threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+from loguru import logger
+
+_KEEP_FINISHED = 50
+
+class Job:
+    def __init__(self, kind: str, params: Dict):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.params = dict(params)
+        self.state = "queued"          # queued | running | succeeded | failed
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.progress: Dict = {"stage": "queued", "done": 0, "total": 0}
+        self.result: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self.done = threading.Event()
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "params": self.params,
+            "state": self.state,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "progress": dict(self.progress),
+            "result": self.result,
+            "error": self.error,
+        }
+
+class IngestQueue:
+    """Runs `runner(progress=..., **params)` jobs one at a time on a worker thread."""
+    def __init__(self, runner: Callable[..., Dict]):
+        self._runner = runner
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._running: Optional[Job] = None
+        self._queued: Optional[Job] = None
+        self._worker: Optional[threading.Thread] = None
+
+    def submit(self, kind: str, **params) -> Job:
+        with self._lock:
+            if self._queued is not None:
+                # Coalesce into the waiting job: an OpenAI request stays one,
+                # and different files widen it to a full incremental run.
+                old = self._queued.params
+                merged = {**old, **params}
+                if "force_openai" in merged:
+                    merged["force_openai"] = bool(old.get("force_openai") or params.get("force_openai"))
+                if old.get("only_file") != params.get("only_file"):
+                    merged["only_file"] = None
+                self._queued.params = merged
+                return self._queued
+            job = Job(kind, params)
+            self._jobs[job.id] = job
+            self._queued = job
+            self._trim()
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._loop, name="ingest-worker", daemon=True)
+                self._worker.start()
+            return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            return [j.to_dict() for j in reversed(self._jobs.values())]
+
+    def busy(self) -> bool:
+        with self._lock:
+            return self._running is not None or self._queued is not None
+
+    def _trim(self) -> None:
+        finished = [j for j in self._jobs.values() if j.state in ("succeeded", "failed")]
+        for j in finished[:max(0, len(finished) - _KEEP_FINISHED)]:
+            self._jobs.pop(j.id, None)
+
+    def _loop(self) -> None:
+        while True:
+            with self._lock:
+                job, self._queued = self._queued, None
+                self._running = job
+                if job is None:
+                    self._worker = None
+                    return
+            self._run(job)
+            with self._lock:
+                self._running = None
+
+    def _run(self, job: Job) -> None:
+        def progress(stage: str, done: int = 0, total: int = 0) -> None:
+            job.progress = {"stage": stage, "done": done, "total": total}
+
+        job.state, job.started_at = "running", time.time()
+        logger.info(f"Ingest job {job.id} started: {job.params}")
+        try:
+            payload = self._runner(progress=progress, **job.params)
+            job.result = {"meta": payload["meta"]}
+            job.state = "succeeded"
+            progress("done", job.progress.get("total", 0), job.progress.get("total", 0))
+        except Exception as e:
+            logger.exception(f"Ingest job {job.id} failed: {e}")
+            job.error = str(e)
+            job.state = "failed"
+        finally:
+            job.finished_at = time.time()
+            job.done.set()
+            logger.info(f"Ingest job {job.id} {job.state} in {job.finished_at - job.started_at:.1f}s")
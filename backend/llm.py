@@ -0,0 +1,90 @@
+# backend/llm.py
+"""
+Application-lifetime AsyncOpenAI client for chat completions.
+
+One client (and one pooled httpx connection pool) serves every request, so
+TLS connections are reused and hundreds of completions can be in flight on
+the event loop without tying up threadpool workers.
+"""
+import os, time
+from typing import AsyncIterator, Dict, List, Optional
+from loguru import logger
+
+import metrics
+
+OPENAI_MODEL          = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+LLM_MAX_CONNECTIONS   = int(os.getenv("LLM_MAX_CONNECTIONS", "256"))
+LLM_MAX_KEEPALIVE     = int(os.getenv("LLM_MAX_KEEPALIVE", "64"))
+LLM_KEEPALIVE_EXPIRY  = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+LLM_TIMEOUT           = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_CONNECT_TIMEOUT   = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_MAX_RETRIES       = int(os.getenv("LLM_MAX_RETRIES", "2"))
+
+_client = None
+
+def get_client():
+    """The shared AsyncOpenAI client, created on first use."""
+    global _client
+    if _client is None:
+        import httpx
+        from openai import AsyncOpenAI
+
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_KEEPALIVE,
+                keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+        )
+        _client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            http_client=http_client,
+            max_retries=LLM_MAX_RETRIES,
+        )
+        logger.info(f"Opened LLM client pool (max_connections={LLM_MAX_CONNECTIONS})")
+    return _client
+
+async def aclose() -> None:
+    global _client
+    if _client is not None:
+        client, _client = _client, None
+        await client.close()
+
+async def chat(messages: List[Dict], temperature: float = 0.2, model: Optional[str] = None, **kwargs) -> str:
+    """One chat completion; returns the message content."""
+    model = model or OPENAI_MODEL
+    t0 = time.perf_counter()
+    try:
+        rsp = await get_client().chat.completions.create(
+            model=model,
+            temperature=temperature,
+            messages=messages,
+            **kwargs,
+        )
+    except Exception:
+        metrics.LLM_ERRORS.inc(model=model, kind="chat")
+        raise
+    metrics.LLM_COMPLETION.observe(time.perf_counter() - t0, model=model, kind="chat")
+    return rsp.choices[0].message.content
+
+async def chat_stream(messages: List[Dict], temperature: float = 0.2, model: Optional[str] = None,
+                      **kwargs) -> AsyncIterator[str]:
+    """Stream a chat completion, yielding content deltas as they arrive."""
+    model = model or OPENAI_MODEL
+    t0 = time.perf_counter()
+    try:
+        stream = await get_client().chat.completions.create(
+            model=model,
+            temperature=temperature,
+            messages=messages,
+            stream=True,
+            **kwargs,
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    except Exception:
+        metrics.LLM_ERRORS.inc(model=model, kind="stream")
+        raise
+    metrics.LLM_COMPLETION.observe(time.perf_counter() - t0, model=model, kind="stream")
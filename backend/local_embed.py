@@ -0,0 +1,114 @@
+# backend/local_embed.py
+"""
+Dependency-light local embedder: hashed TF-IDF over word unigrams, word
+bigrams and character 3/4-grams, folded into a fixed number of dimensions.
+
+- Features are hashed with crc32 / a fixed integer mix, so vectors are
+  identical across processes and machines (no PYTHONHASHSEED dependence).
+- IDF is fitted per index at ingest time over LOCAL_FEATURE_BITS buckets
+  and stored with the index, so queries are weighted exactly like chunks.
+- Folding feature hashes into LOCAL_EMBED_DIM signed buckets is a sparse
+  random projection; rows come back L2-normalised.
+- Work is done in batches with NumPy; character n-grams are hashed with
+  vectorised rolling arithmetic rather than per-gram Python calls.
+"""
+import os, re, zlib
+from typing import List, Tuple
+
+LOCAL_EMBED_DIM    = int(os.getenv("LOCAL_EMBED_DIM", "384"))
+LOCAL_FEATURE_BITS = int(os.getenv("LOCAL_FEATURE_BITS", "18"))
+MODEL_NAME         = "hash-tfidf-v1"
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+_BATCH = 2048
+_CHAR_NGRAMS = (3, 4)
+_SALT_WORD, _SALT_BIGRAM, _SALT_PROJ = 0x9E3779B1, 0x85EBCA77, 0x27D4EB2F
+
+def _mix(h):
+    """murmur3 finaliser on a uint32 array."""
+    import numpy as np
+
+    h = h.astype(np.uint32, copy=True)
+    h ^= h >> np.uint32(16)
+    h *= np.uint32(0x85EBCA6B)
+    h ^= h >> np.uint32(13)
+    h *= np.uint32(0xC2B2AE35)
+    h ^= h >> np.uint32(16)
+    return h
+
+def _features(text: str):
+    """uint32 feature hashes (with repeats) for one text."""
+    import numpy as np
+
+    words = _TOKEN.findall(text.lower())
+    parts = []
+    if words:
+        parts.append(np.fromiter((zlib.crc32(w.encode("utf-8")) ^ _SALT_WORD for w in words),
+                                 dtype=np.uint32, count=len(words)))
+    if len(words) > 1:
+        parts.append(np.fromiter((zlib.crc32(f"{a} {b}".encode("utf-8")) ^ _SALT_BIGRAM
+                                  for a, b in zip(words, words[1:])),
+                                 dtype=np.uint32, count=len(words) - 1))
+
+    padded = (" " + " ".join(words) + " ").encode("utf-8")
+    b = np.frombuffer(padded, dtype=np.uint8).astype(np.uint32)
+    for n in _CHAR_NGRAMS:
+        if len(b) < n:
+            continue
+        h = np.full(len(b) - n + 1, n, dtype=np.uint32)
+        for j in range(n):
+            h = h * np.uint32(16777619) + b[j:len(b) - n + 1 + j]
+        parts.append(h)
+
+    if not parts:
+        return np.zeros(0, dtype=np.uint32)
+    return _mix(np.concatenate(parts))
+
+def _batch_counts(texts: List[str]) -> Tuple:
+    """(doc ids, feature hashes, counts) of the distinct features per text."""
+    import numpy as np
+
+    feats = [_features(t) for t in texts]
+    docs = np.repeat(np.arange(len(texts), dtype=np.int64), [len(f) for f in feats])
+    hashes = np.concatenate(feats) if feats else np.zeros(0, dtype=np.uint32)
+    keys, counts = np.unique((docs << 32) | hashes.astype(np.int64), return_counts=True)
+    return keys >> 32, (keys & 0xFFFFFFFF).astype(np.uint32), counts
+
+def doc_freqs(texts: List[str], bits: int = LOCAL_FEATURE_BITS):
+    """Document frequency per feature bucket; sums across batches of a corpus."""
+    import numpy as np
+
+    size = 1 << bits
+    df = np.zeros(size, dtype=np.int64)
+    for s in range(0, len(texts), _BATCH):
+        _, hashes, _ = _batch_counts(texts[s:s + _BATCH])
+        df += np.bincount(hashes & np.uint32(size - 1), minlength=size)
+    return df
+
+def idf_from_df(df, n: int):
+    """Smoothed IDF per feature bucket: log((1 + N) / (1 + df)) + 1."""
+    import numpy as np
+
+    return (np.log((1.0 + n) / (1.0 + df)) + 1.0).astype(np.float32)
+
+def fit_idf(texts: List[str], bits: int = LOCAL_FEATURE_BITS):
+    return idf_from_df(doc_freqs(texts, bits), len(texts))
+
+def embed(texts: List[str], idf=None, dim: int = LOCAL_EMBED_DIM):
+    """[len(texts), dim] float32, L2-normalised. Without idf, plain TF."""
+    import numpy as np
+
+    out = np.zeros((len(texts), dim), dtype=np.float32)
+    for s in range(0, len(texts), _BATCH):
+        batch = texts[s:s + _BATCH]
+        docs, hashes, counts = _batch_counts(batch)
+        weights = 1.0 + np.log(counts.astype(np.float32))
+        if idf is not None:
+            weights *= np.asarray(idf)[hashes & np.uint32(len(idf) - 1)]
+        proj = _mix(hashes ^ np.uint32(_SALT_PROJ))
+        signs = 1.0 - 2.0 * (proj >> np.uint32(31)).astype(np.float32)
+        buckets = (proj % np.uint32(dim)).astype(np.int64)
+        flat = np.bincount(docs * dim + buckets, weights=weights * signs, minlength=len(batch) * dim)
+        out[s:s + len(batch)] = flat.reshape(len(batch), dim)
+    norms = np.linalg.norm(out, axis=1, keepdims=True)
+    return out / np.maximum(norms, 1e-8)
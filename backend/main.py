@@ -1,10 +1,16 @@
-from fastapi import FastAPI, Depends, Header, HTTPException, Query, Body, UploadFile, File
+import time
+_IMPORT_T0 = time.perf_counter()   # startup is timed from here (app imports included)
+
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Body, UploadFile, File, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse, PlainTextResponse
+from starlette.background import BackgroundTask
 from loguru import logger
 from dotenv import load_dotenv
 from typing import Optional, List, Dict, Any
-import os, json, shutil, time
+from contextlib import asynccontextmanager
+import os, json, shutil, tempfile, zipfile, asyncio
+import anyio
 
 # -------------------------
 # Load env
@@ -13,22 +19,68 @@ load_dotenv()
 API_KEY       = os.getenv("BACKEND_API_KEY", "")
 ALLOW_ORIGINS = [os.getenv("ALLOW_ORIGIN", "*")]
 OPENAI_PRESENT = bool(os.getenv("OPENAI_API_KEY"))
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", "64"))  # sync handlers + off-loop search
+STARTUP_WARMUP  = os.getenv("STARTUP_WARMUP", "background").lower()  # background | blocking | off
 
 BASE_DIR  = os.path.dirname(__file__)
-DATA_PATH = os.path.join(BASE_DIR, "data", "gsos_chunks.json")
-DOCS_DIR  = os.path.join(BASE_DIR, "docs")
+DOCS_DIR  = os.getenv("DOCS_DIR", os.path.join(BASE_DIR, "docs"))
 
 # -------------------------
 # Local modules
 # -------------------------
 from schemas import GenerateQuery, GenerateResponse
-from generation import generate_with_openai, _fallback_questions
-from search import search_chunks, ingest_docs_to_json
+from generation import generate_with_openai, _fallback_questions, SURVEYS
+from search import search_chunks, search_chunks_many, search_pains, cached_query_embedding, ingest_docs_to_json, get_index, warm_up, INDEX_BASE, QUERY_EMBEDDINGS
+from caching import SemanticCache
+import context
+import index_store
+import llm
+import metrics
+from jobs import IngestQueue
 
 # -------------------------
 # App
 # -------------------------
-app = FastAPI(title="GSOS Survey & RAG API", version="1.4.0")
+# Readiness: set once the index is loaded, checked and warm (see warm_up).
+STARTUP: Dict[str, Any] = {"ready": False, "imports_s": None, "warmup_s": None, "index": None, "error": None}
+
+async def _warm_up() -> None:
+    t0 = time.perf_counter()
+    try:
+        info = await anyio.to_thread.run_sync(warm_up)
+    except Exception as e:
+        logger.exception(f"Index warm-up failed: {e}")
+        STARTUP["error"] = str(e)
+        return
+    STARTUP["index"] = info
+    STARTUP["warmup_s"] = round(time.perf_counter() - t0, 3)
+    STARTUP["ready"] = True
+    total = time.perf_counter() - _IMPORT_T0
+    metrics.STARTUP.set(STARTUP["warmup_s"], phase="warmup")
+    metrics.STARTUP.set(total, phase="total")
+    logger.info(f"Startup: imports {STARTUP['imports_s']:.2f}s, warm-up {STARTUP['warmup_s']:.2f}s "
+                f"({info['rows']} rows, {info['storage']}), ready {total:.2f}s after import")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    STARTUP["imports_s"] = round(time.perf_counter() - _IMPORT_T0, 3)
+    metrics.STARTUP.set(STARTUP["imports_s"], phase="imports")
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    if OPENAI_PRESENT:
+        llm.get_client()
+    warming = None
+    if STARTUP_WARMUP == "blocking":
+        await _warm_up()
+    elif STARTUP_WARMUP == "off":
+        STARTUP["ready"] = True
+    else:
+        warming = asyncio.create_task(_warm_up())
+    yield
+    if warming is not None and not warming.done():
+        warming.cancel()
+    await llm.aclose()
+
+app = FastAPI(title="GSOS Survey & RAG API", version="1.4.0", lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=ALLOW_ORIGINS,
@@ -36,6 +88,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(metrics.MetricsMiddleware)
 
 def require_key(x_api_key: str = Header(default="")):
     if API_KEY and x_api_key != API_KEY:
@@ -46,18 +99,29 @@ def require_key(x_api_key: str = Header(default="")):
 # Health
 # -------------------------
 @app.get("/health")
-def health():
-    return {"ok": True}
+async def health():
+    """Liveness: the process is up and serving. See /health/ready for readiness."""
+    return {"ok": True, "ready": STARTUP["ready"], "uptime_s": round(time.perf_counter() - _IMPORT_T0, 1)}
+
+@app.get("/health/ready")
+async def health_ready():
+    """Readiness: 200 once the index is loaded, checked and warm; 503 until then."""
+    return JSONResponse(STARTUP, status_code=200 if STARTUP["ready"] else 503)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Prometheus text exposition (latencies only, no content; unauthenticated like /health)."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 # -------------------------
 # Survey Generation
 # -------------------------
 @app.get("/generate", response_model=GenerateResponse)
-def generate(role: str = Query("retailer"), count: int = Query(12, ge=10, le=15), seed: Optional[int] = None, _=Depends(require_key)):
+async def generate(role: str = Query("retailer"), count: int = Query(12, ge=10, le=15), seed: Optional[int] = None, _=Depends(require_key)):
     q = GenerateQuery(role=role, count=count, seed=seed)
     try:
         if OPENAI_PRESENT:
-            questions = generate_with_openai(q)
+            questions = await generate_with_openai(q)
         else:
             questions = _fallback_questions(q)
     except Exception as e:
@@ -68,41 +132,184 @@ def generate(role: str = Query("retailer"), count: int = Query(12, ge=10, le=15)
 # -------------------------
 # RAG Ask
 # -------------------------
-@app.post("/ask")
-def ask(payload: dict = Body(...), _=Depends(require_key)):
+def _ask_messages(query: str, packed: context.PackedContext) -> List[Dict]:
+    prompt = f"Answer the question using only the provided context.\n\nQuestion: {query}\n\nContext:\n{packed.text}\n\nAnswer:"
+    return [
+        {"role": "system", "content": "Answer strictly from the given context."},
+        {"role": "user", "content": prompt},
+    ]
+
+# Answers reused for paraphrased questions: same index version, same cited
+# chunks, and query embeddings at least ASK_CACHE_THRESHOLD cosine apart.
+ASK_CACHE_SIZE      = int(os.getenv("ASK_CACHE_SIZE", "1024"))
+ASK_CACHE_THRESHOLD = float(os.getenv("ASK_CACHE_THRESHOLD", "0.95"))
+ANSWERS = SemanticCache(ASK_CACHE_SIZE, ASK_CACHE_THRESHOLD, name="ask_answers")
+
+def _semantic_lookup(query: str, meta: Dict, results: List[Dict]):
+    """
+    (cached answer or None, cache info, store callback). The callback saves a
+    freshly generated answer under this query. The query vector is the one
+    retrieval cached; when there is none (lexical search, or embedding
+    failed) the answer cache is skipped rather than embedding again.
+    """
+    version = meta.get("version")
+    scope = (version, frozenset((r["source_path"], r["chunk_index"]) for r in results))
+    info = {"hit": False, "similarity": None}
+    vec, vec_version = cached_query_embedding(query)
+    if vec is None or vec_version != version:     # not embedded, or index swapped mid-request
+        return None, info, lambda answer: None
+
+    found = ANSWERS.lookup(vec, scope)
+    if found is not None:
+        answer, similarity, matched = found
+        return answer, {"hit": True, "similarity": round(similarity, 4), "matched_query": matched}, lambda answer: None
+    return None, info, lambda answer: ANSWERS.store(vec, scope, query, answer)
+
+def _parse_sources(payload: dict):
+    """
+    (include, exclude) source filters from `"sources"`: a list of names /
+    glob patterns to search in, or {"include": [...], "exclude": [...]}.
+    """
+    spec = payload.get("sources")
+    if spec is None:
+        return None, None
+    if isinstance(spec, list):
+        spec = {"include": spec}
+    if not isinstance(spec, dict) or set(spec) - {"include", "exclude"}:
+        raise HTTPException(status_code=400, detail="invalid_sources")
+    out = []
+    for key in ("include", "exclude"):
+        values = spec.get(key) or []
+        if not isinstance(values, list) or not all(isinstance(v, str) and v.strip() for v in values):
+            raise HTTPException(status_code=400, detail="invalid_sources")
+        out.append([v.strip() for v in values] or None)
+    return out[0], out[1]
+
+def _parse_ask(payload: dict):
     query = (payload.get("query") or "").strip()
     if not query:
         raise HTTPException(status_code=400, detail="query_required")
-    top_k = int(payload.get("top_k") or 5)
-    results, meta = search_chunks(query, top_k=top_k)
+    mode = payload.get("mode")
+    if mode is not None and mode not in ("dense", "hybrid", "lexical"):
+        raise HTTPException(status_code=400, detail="invalid_mode")
+    include, exclude = _parse_sources(payload)
+    return query, int(payload.get("top_k") or 5), mode, include, exclude
 
-    answer = None
+@app.post("/ask")
+async def ask(request: Request, payload: dict = Body(...), _=Depends(require_key)):
+    if "text/event-stream" in request.headers.get("accept", ""):
+        return await ask_stream(payload)
+    query, top_k, mode, include, exclude = _parse_ask(payload)
+    results, meta = await anyio.to_thread.run_sync(search_chunks, query, top_k, None, mode, include, exclude)
+    packed = context.pack(results)
+
+    answer, cache = None, {"hit": False, "similarity": None}
     if OPENAI_PRESENT and results:
-        try:
-            from openai import OpenAI
-            client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-            ctx = "\n\n".join([f"[{r['source_path']}#{r['chunk_index']}] {r['text']}" for r in results])
-            prompt = f"Answer the question using only the provided context.\n\nQuestion: {query}\n\nContext:\n{ctx}\n\nAnswer:"
-            rsp = client.chat.completions.create(
-                model=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
-                temperature=0.2,
-                messages=[
-                    {"role": "system", "content": "Answer strictly from the given context."},
-                    {"role": "user", "content": prompt},
-                ],
-            )
-            answer = rsp.choices[0].message.content
-        except Exception as e:
-            logger.exception(f"OpenAI answer failed: {e}")
-            answer = None
+        answer, cache, remember = await anyio.to_thread.run_sync(_semantic_lookup, query, meta, results)
+        if answer is None:
+            try:
+                answer = await llm.chat(_ask_messages(query, packed), temperature=0.2)
+                remember(answer)
+            except Exception as e:
+                logger.exception(f"OpenAI answer failed: {e}")
+                answer = None
 
-    return {"ok": True, "meta": meta.get("meta", {}), "results": results, "answer": answer}
+    return {"ok": True, "meta": meta.get("meta", {}), "mode": meta.get("mode"), "results": results,
+            "answer": answer, "cache": cache, "context": packed.info()}
+
+def _sse(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/ask/stream")
+async def ask_stream(payload: dict = Body(...), _=Depends(require_key)):
+    """
+    Server-sent events: `citations` (the chunks packed into the prompt, as
+    soon as retrieval is done), then one `token` event per answer delta (a
+    single one for a cached answer), then `done` with cache, context and
+    timing metadata.
+    """
+    query, top_k, mode, include, exclude = _parse_ask(payload)
+
+    async def events():
+        t0 = time.perf_counter()
+        results, meta = await anyio.to_thread.run_sync(search_chunks, query, top_k, None, mode, include, exclude)
+        retrieval_ms = (time.perf_counter() - t0) * 1000
+        packed = context.pack(results)
+        yield _sse("citations", {"citations": packed.citations(), "meta": meta.get("meta", {})})
+
+        first_token_ms = None
+        answered = False
+        cache = {"hit": False, "similarity": None}
+        if OPENAI_PRESENT and results:
+            cached, cache, remember = await anyio.to_thread.run_sync(_semantic_lookup, query, meta, results)
+            if cached is not None:
+                first_token_ms = (time.perf_counter() - t0) * 1000
+                answered = True
+                yield _sse("token", {"delta": cached})
+            else:
+                parts = []
+                try:
+                    async for delta in llm.chat_stream(_ask_messages(query, packed), temperature=0.2):
+                        if first_token_ms is None:
+                            first_token_ms = (time.perf_counter() - t0) * 1000
+                        answered = True
+                        parts.append(delta)
+                        yield _sse("token", {"delta": delta})
+                    if parts:
+                        remember("".join(parts))
+                except Exception as e:
+                    logger.exception(f"OpenAI answer stream failed: {e}")
+                    yield _sse("error", {"error": "answer_failed"})
+
+        yield _sse("done", {
+            "answered": answered,
+            "mode": meta.get("mode"),
+            "cache": cache,
+            "context": packed.info(),
+            "timing": {
+                "retrieval_ms": round(retrieval_ms, 1),
+                "first_token_ms": None if first_token_ms is None else round(first_token_ms, 1),
+                "total_ms": round((time.perf_counter() - t0) * 1000, 1),
+            },
+        })
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# -------------------------
+# Batch search
+# -------------------------
+SEARCH_BATCH_MAX = int(os.getenv("SEARCH_BATCH_MAX", "2000"))
+
+@app.post("/search/batch")
+async def search_batch(payload: dict = Body(...), _=Depends(require_key)):
+    queries = payload.get("queries")
+    if not isinstance(queries, list) or not queries or not all(isinstance(q, str) and q.strip() for q in queries):
+        raise HTTPException(status_code=400, detail="queries_required")
+    if len(queries) > SEARCH_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"too_many_queries:{SEARCH_BATCH_MAX}")
+    mode = payload.get("mode")
+    if mode is not None and mode not in ("dense", "hybrid", "lexical"):
+        raise HTTPException(status_code=400, detail="invalid_mode")
+    top_k = int(payload.get("top_k") or 5)
+    include, exclude = _parse_sources(payload)
+    results, meta = await anyio.to_thread.run_sync(search_chunks_many, [q.strip() for q in queries], top_k, mode,
+                                                   include, exclude)
+    return {
+        "ok": True,
+        "meta": meta.get("meta", {}),
+        "mode": meta.get("mode"),
+        "results": [{"query": q, "results": r} for q, r in zip(queries, results)],
+    }
 
 # -------------------------
 # Analyze (post-survey)
 # -------------------------
 @app.post("/analyze")
-def analyze(payload: dict = Body(...), _=Depends(require_key)):
+async def analyze(payload: dict = Body(...), _=Depends(require_key)):
     role = (payload.get("role") or "retailer").strip()
     answers = payload.get("answers") or []
 
@@ -124,13 +331,12 @@ def analyze(payload: dict = Body(...), _=Depends(require_key)):
     # Build a pain query from MCQ values (plus role) to ground RAG search
     selected_mcq = [v for a in answers if (a.get("type") or "").lower() == "mcq" for v in (a.get("values") or [])]
     unique_mcq = sorted(set(selected_mcq))
-    pain_query = f"{role} pains: {', '.join(unique_mcq)}" if unique_mcq else role
 
-    # Retrieve relevant chunks
-    results, meta = search_chunks(pain_query, top_k=6)
-    ctx = "\n\n".join(
-        [f"[{r['source_path']}#{r['chunk_index']}] {r['text']}" for r in results]
-    ) if results else ""
+    # Retrieve relevant chunks (precomputed at ingest when role + options are in the table)
+    results, meta, retrieval = await anyio.to_thread.run_sync(search_pains, role, unique_mcq, 6)
+    metrics.ANALYZE_RETRIEVAL.inc(source=retrieval)
+    packed = context.pack(results)
+    ctx = packed.text
 
     # Very simple savings heuristics (you can refine later)
     selected_set = set(unique_mcq)
@@ -145,10 +351,6 @@ def analyze(payload: dict = Body(...), _=Depends(require_key)):
     summary = None
     if OPENAI_PRESENT:
         try:
-            from openai import OpenAI
-            client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-            model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
-
             prompt = (
                 "You are the GSOS assistant.\n\n"
                 "Task: Using ONLY the supplied context (if any) plus the respondent profile, "
@@ -158,19 +360,14 @@ def analyze(payload: dict = Body(...), _=Depends(require_key)):
                 "3) Onboarding nudge (1 short paragraph)\n\n"
                 f"ROLE: {role}\n\n"
                 f"PROFILE:\n{profile_text}\n\n"
-                f"CONTEXT (citations in [file#chunk] form):\n{ctx if ctx else '(no indexed context found)'}\n\n"
+                f"CONTEXT (citations in [file#chunk] or [file#first-last] form):\n{ctx if ctx else '(no indexed context found)'}\n\n"
                 "Now produce the three sections in plain text."
             )
 
-            rsp = client.chat.completions.create(
-                model=model,
-                temperature=0.2,
-                messages=[
-                    {"role": "system", "content": "Be concise, concrete, and business-friendly."},
-                    {"role": "user", "content": prompt},
-                ],
-            )
-            summary = rsp.choices[0].message.content
+            summary = await llm.chat([
+                {"role": "system", "content": "Be concise, concrete, and business-friendly."},
+                {"role": "user", "content": prompt},
+            ], temperature=0.2)
         except Exception as e:
             logger.exception(f"OpenAI compose failed: {e}")
             summary = None
@@ -185,13 +382,14 @@ def analyze(payload: dict = Body(...), _=Depends(require_key)):
         "ok": True,
         "savings": savings,
         "summary": summary,
-        "citations": [{"source": r["source_path"], "chunk": r["chunk_index"]} for r in results],
+        "citations": [{"source": c["source"], "chunk": c["chunk"]} for c in packed.citations()],
         "plans": plans,
         "onboarding": {
             "question": "Would you like to onboard GSOS?",
             "options": ["Immediately","1–2 months","Quarterly","Not now"]
         },
         "meta": meta.get("meta", {}),
+        "retrieval": retrieval,
     }
 
 # -------------------------
@@ -209,28 +407,63 @@ def list_docs(_=Depends(require_key)):
             out.append({"path": rel, "size": size})
     return {"ok": True, "docs_dir": DOCS_DIR, "files": out}
 
+INGEST_JOBS = IngestQueue(ingest_docs_to_json)
+
+async def _job_response(job, wait: bool, **extra):
+    if wait:
+        await anyio.to_thread.run_sync(job.done.wait)
+    out = {"ok": job.state != "failed", "job": job.to_dict(), **extra}
+    out["meta"] = (job.result or {}).get("meta") or get_index().meta
+    return out
+
 @app.post("/admin/reingest")
-def reingest(only_file: Optional[str] = Query(None), force_openai: bool = Query(False), _=Depends(require_key)):
-    payload = ingest_docs_to_json(only_file=only_file, force_openai=force_openai)
-    return {"ok": True, "meta": payload["meta"]}
+async def reingest(only_file: Optional[str] = Query(None), force_openai: bool = Query(False),
+                   wait: bool = Query(False), _=Depends(require_key)):
+    job = INGEST_JOBS.submit("reingest", only_file=only_file, force_openai=force_openai)
+    return await _job_response(job, wait)
+
+@app.get("/admin/jobs")
+def list_jobs(_=Depends(require_key)):
+    return {"ok": True, "jobs": INGEST_JOBS.list()}
+
+@app.get("/admin/jobs/{job_id}")
+def job_status(job_id: str, _=Depends(require_key)):
+    job = INGEST_JOBS.get(job_id)
+    if job is None: raise HTTPException(status_code=404, detail="job_not_found")
+    return {"ok": True, "job": job.to_dict()}
 
 @app.get("/admin/index-meta")
 def index_meta(_=Depends(require_key)):
-    if not os.path.exists(DATA_PATH): return {"ok": True,"meta":{"created_at":0,"count":0,"embed_backend":"none"}}
-    with open(DATA_PATH,"r",encoding="utf-8") as f: idx=json.load(f)
-    return {"ok": True,"meta":idx.get("meta",{})}
+    return {"ok": True,"meta":get_index().meta}
+
+@app.get("/admin/metrics")
+def admin_metrics(_=Depends(require_key)):
+    return {"ok": True, "metrics": metrics.snapshot()}
+
+@app.get("/admin/cache-stats")
+def cache_stats(_=Depends(require_key)):
+    return {"ok": True, "caches": [QUERY_EMBEDDINGS.stats(), SURVEYS.stats(), ANSWERS.stats()]}
 
 @app.get("/admin/download-index")
 def download_index(_=Depends(require_key)):
-    if not os.path.exists(DATA_PATH): return JSONResponse({"ok":False,"error":"index not found"},status_code=404)
-    return FileResponse(DATA_PATH,media_type="application/json",filename="gsos_chunks.json")
+    get_index()  # converts a legacy JSON index on first read
+    files = index_store.bundle_files(INDEX_BASE)
+    if not files: return JSONResponse({"ok":False,"error":"index not found"},status_code=404)
+    fd, tmp = tempfile.mkstemp(suffix=".zip"); os.close(fd)
+    with zipfile.ZipFile(tmp, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for p in files: zf.write(p, arcname=os.path.basename(p))
+    return FileResponse(tmp,media_type="application/zip",filename="gsos_index.zip",background=BackgroundTask(os.remove,tmp))
 
 @app.post("/admin/upload")
-def admin_upload(file: UploadFile = File(...), _=Depends(require_key)):
+async def admin_upload(file: UploadFile = File(...), wait: bool = Query(False), _=Depends(require_key)):
     allowed={".docx",".pdf",".md",".txt",".html",".htm"}
-    name=file.filename or "uploaded"; ext=os.path.splitext(name)[1].lower()
+    name=os.path.basename(file.filename or "uploaded"); ext=os.path.splitext(name)[1].lower()
     if ext not in allowed: raise HTTPException(status_code=400,detail=f"unsupported_extension:{ext}")
     os.makedirs(DOCS_DIR,exist_ok=True); dest=os.path.join(DOCS_DIR,name)
-    with open(dest,"wb") as out: shutil.copyfileobj(file.file,out)
-    payload=ingest_docs_to_json()
-    return {"ok":True,"saved":name,"meta":payload["meta"]}
+    def _save():
+        # .part is not a supported extension, so a running ingest never sees a half-written file
+        with open(dest+".part","wb") as out: shutil.copyfileobj(file.file,out)
+        os.replace(dest+".part",dest)
+    await anyio.to_thread.run_sync(_save)
+    job = INGEST_JOBS.submit("upload", only_file=name, force_openai=False)
+    return await _job_response(job, wait, saved=name)
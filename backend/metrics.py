@@ -0,0 +1,249 @@
+# backend/metrics.py
+"""
+In-process counters, gauges and latency histograms for the backend, exposed
+as Prometheus text (GET /metrics) and JSON (GET /admin/metrics).
+
+Recording a sample is a dict lookup, a bisect and a couple of additions under
+a lock, cheap enough to leave on in production. Series live for the life of
+the process; labels are kept to small fixed sets (route templates, backend
+names, stage names) so cardinality stays bounded.
+
+The HTTP middleware stores the matched route template in a context
+variable. Metrics with an `endpoint` label pick it up automatically, also
+from anyio worker threads (which run in a copy of the request context).
+Work outside a request, like background ingest, is labelled "-".
+"""
+import bisect, contextvars, threading, time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+_endpoint: contextvars.ContextVar = contextvars.ContextVar("metrics_endpoint", default="-")
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 900.0)
+
+_REGISTRY: List["_Metric"] = []
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._series: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def _key(self, labels: Dict) -> Tuple[str, ...]:
+        if "endpoint" in self.labelnames and "endpoint" not in labels:
+            labels["endpoint"] = _endpoint.get()
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def _label_str(self, key: Tuple[str, ...], extra: str = "") -> str:
+        parts = [f'{n}="{_escape(v)}"' for n, v in zip(self.labelnames, key)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _fmt(v: float) -> str:
+    return repr(float(v)) if v != float("inf") else "+Inf"
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0.0) + amount
+
+    def _render(self) -> List[str]:
+        return [f"{self.name}{self._label_str(k)} {_fmt(v)}" for k, v in sorted(self._series.items())]
+
+    def _snapshot(self, key, value) -> Dict:
+        return {"value": value}
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = float(value)
+
+    _render = Counter._render
+    _snapshot = Counter._snapshot
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            s[0][i] += 1
+            s[1] += value
+            s[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time of the with-block (also when it raises)."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def _render(self) -> List[str]:
+        out = []
+        for key, (counts, total, n) in sorted(self._series.items()):
+            cum = 0
+            for le, c in zip(self.buckets + (float("inf"),), counts):
+                cum += c
+                le_label = 'le="%s"' % _fmt(le)
+                out.append(f"{self.name}_bucket{self._label_str(key, le_label)} {cum}")
+            out.append(f"{self.name}_sum{self._label_str(key)} {_fmt(total)}")
+            out.append(f"{self.name}_count{self._label_str(key)} {n}")
+        return out
+
+    def _quantile(self, counts: List[int], n: int, q: float) -> Optional[float]:
+        """Bucket-interpolated quantile, as Prometheus' histogram_quantile does."""
+        if not n:
+            return None
+        rank, cum, lower = q * n, 0, 0.0
+        for upper, c in zip(self.buckets, counts):
+            if cum + c >= rank and c:
+                return lower + (upper - lower) * (rank - cum) / c
+            cum += c
+            lower = upper
+        return self.buckets[-1]
+
+    def _snapshot(self, key, value) -> Dict:
+        counts, total, n = value
+        return {
+            "count": n,
+            "sum_s": round(total, 6),
+            "mean_ms": round(total / n * 1000, 3) if n else None,
+            **{f"p{int(q * 100)}_ms": (None if v is None else round(v * 1000, 3))
+               for q in (0.5, 0.95, 0.99) for v in [self._quantile(counts, n, q)]},
+        }
+
+# -------------------------
+# Exposition
+# -------------------------
+def render() -> str:
+    """All metrics in the Prometheus text exposition format (0.0.4)."""
+    lines = []
+    for m in _REGISTRY:
+        with m._lock:
+            body = m._render()
+        lines.append(f"# HELP {m.name} {m.help}")
+        lines.append(f"# TYPE {m.name} {m.kind}")
+        lines.extend(body)
+    return "\n".join(lines) + "\n"
+
+def snapshot() -> Dict:
+    """All metrics as JSON: one entry per labelled series."""
+    out = {}
+    for m in _REGISTRY:
+        with m._lock:
+            items = [(k, [list(v[0]), v[1], v[2]] if isinstance(v, list) else v) for k, v in m._series.items()]
+        out[m.name] = {
+            "type": m.kind,
+            "help": m.help,
+            "series": [{"labels": dict(zip(m.labelnames, k)), **m._snapshot(k, v)} for k, v in sorted(items)],
+        }
+    return out
+
+class MetricsMiddleware:
+    """
+    ASGI middleware: counts requests and times them until the last body
+    byte (so SSE streams are timed in full), labelled by route template.
+    """
+    def __init__(self, app):
+        self.app = app
+        self._routes: Dict[Tuple[str, str], str] = {}
+
+    def _endpoint(self, scope) -> str:
+        key = (scope.get("method", ""), scope.get("path", ""))
+        hit = self._routes.get(key)
+        if hit is not None:
+            return hit
+        from starlette.routing import Match
+
+        endpoint = "other"
+        app = scope.get("app")
+        for route in getattr(getattr(app, "router", None), "routes", []):
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                endpoint = getattr(route, "path", "other")
+                break
+        if endpoint != "other" and "{" not in endpoint and len(self._routes) < 1024:
+            self._routes[key] = endpoint   # static paths only: parametrised ones would grow unbounded
+        return endpoint
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        endpoint = self._endpoint(scope)
+        method = scope.get("method", "")
+        status = {"code": 500}
+        token = _endpoint.set(endpoint)
+        t0 = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_LATENCY.observe(time.perf_counter() - t0, endpoint=endpoint, method=method)
+            HTTP_REQUESTS.inc(endpoint=endpoint, method=method, status=str(status["code"]))
+            _endpoint.reset(token)
+
+# -------------------------
+# Backend metrics
+# -------------------------
+HTTP_REQUESTS = Counter("gsos_http_requests_total", "HTTP requests by route and status.",
+                        ("endpoint", "method", "status"))
+HTTP_LATENCY = Histogram("gsos_http_request_seconds", "HTTP request latency, until the last body byte.",
+                         ("endpoint", "method"))
+
+STARTUP = Gauge("gsos_startup_seconds", "Process startup time by phase (imports, warmup, total).", ("phase",))
+
+INDEX_LOAD = Histogram("gsos_index_load_seconds", "Time to map an index generation (or convert legacy JSON).",
+                       ("source",))
+INDEX_ROWS = Gauge("gsos_index_rows", "Rows in the currently loaded index.")
+
+QUERY_EMBED = Histogram("gsos_query_embed_seconds", "Query embedding calls (cache misses only).",
+                        ("endpoint", "backend"))
+QUERY_EMBED_CACHE = Counter("gsos_query_embed_cache_total", "Query embedding cache lookups.",
+                            ("backend", "result"))
+SEARCH_FALLBACK = Counter("gsos_search_lexical_fallback_total", "Dense / hybrid searches answered lexically (query not embedded).",
+                          ("requested",))
+ANALYZE_RETRIEVAL = Counter("gsos_analyze_retrieval_total", "/analyze context lookups by source (precomputed, live).",
+                            ("source",))
+SEARCH_SCORE = Histogram("gsos_search_score_seconds", "Scoring time per retriever (exact, float16, int8, ivf, rescore, bm25, batch).",
+                         ("endpoint", "backend", "method"))
+
+LLM_COMPLETION = Histogram("gsos_llm_completion_seconds", "Chat completion latency (streams: until the last delta).",
+                           ("endpoint", "model", "kind"))
+LLM_ERRORS = Counter("gsos_llm_errors_total", "Failed chat completions.", ("endpoint", "model", "kind"))
+
+INGEST_STAGE = Histogram("gsos_ingest_stage_seconds", "Ingest stage durations (extract and chunk are per file).",
+                         ("stage", "backend"))
+INGEST_CHUNKS = Counter("gsos_ingest_chunks_total", "Chunks written by ingest runs.", ("backend",))
+EMBED_RETRIES = Counter("gsos_embed_retries_total", "Retried embedding batches.", ("reason",))
@@ -0,0 +1,134 @@
+# backend/pain_index.py
+"""
+Precomputed retrieval for /analyze.
+
+/analyze searches with a pain query built from the respondent's role and
+selected MCQ options, which come from a closed vocabulary (the question
+bank). At ingest, every (role, option) query "<role> pains: <option>" and
+every bare role query are embedded once and their PAIN_TOP_N nearest rows
+stored in the index bundle:
+
+    pain_keys    uint8   "role\\toption" keys, "\\n"-separated (option "" = role alone)
+    pain_vecs    float32 [K, dim]  unit query embeddings
+    pain_rows    int64   [K, N]    nearest rows, best first
+    pain_scores  float32 [K, N]    their cosine scores
+
+A lookup with one option (or none) returns the stored list as is. Several
+options take the union of their lists and re-rank it against the actual
+query when that is cheap to embed (local backend), otherwise against the
+mean of their stored query vectors, so no embedding request is made. Roles
+or options outside the table return None and the caller searches live.
+"""
+import os
+from typing import Dict, List, Optional, Tuple
+
+from question_bank import mcq_options
+
+PAIN_ROLES = [r.strip().lower() for r in os.getenv(
+    "PAIN_ROLES", "retailer,distributor,manufacturer,logistics,financier,government").split(",") if r.strip()]
+PAIN_TOP_N = int(os.getenv("PAIN_TOP_N", "50"))   # rows kept per key (hybrid fuses this many)
+
+ARRAYS = ("pain_keys", "pain_vecs", "pain_rows", "pain_scores")
+
+_BLOCK_ROWS = 65536   # index rows scored at a time while building
+
+def pain_query(role: str, options: List[str]) -> str:
+    """The live query /analyze searches with (options sorted, without duplicates)."""
+    opts = sorted(set(options))
+    return f"{role} pains: {', '.join(opts)}" if opts else role
+
+def keys(roles: Optional[List[str]] = None, options: Optional[List[str]] = None) -> List[Tuple[str, str]]:
+    """(role, option) pairs covered by the table; option "" is the bare role."""
+    roles = PAIN_ROLES if roles is None else roles
+    options = mcq_options() if options is None else options
+    return [(r, o) for r in roles for o in [""] + options]
+
+# -------------------------
+# Build
+# -------------------------
+def build(matrix, embed, top_n: int = PAIN_TOP_N) -> Dict:
+    """
+    Arrays (see module docstring) for the unit-row float32 `matrix`.
+    `embed(texts)` embeds queries with the index's backend. Rows are scored
+    in blocks, keeping a running top-N per key, so one pass over the matrix
+    serves every key.
+    """
+    import numpy as np
+
+    pairs = keys()
+    Q = np.asarray(embed([pain_query(r, [o] if o else []) for r, o in pairs]), dtype=np.float32)
+    Q /= np.maximum(np.linalg.norm(Q, axis=1, keepdims=True), 1e-8)
+
+    n = len(matrix)
+    keep = min(top_n, n)
+    best_rows = np.zeros((len(Q), 0), dtype=np.int64)
+    best_scores = np.zeros((len(Q), 0), dtype=np.float32)
+    for s in range(0, n, _BLOCK_ROWS):
+        block = np.asarray(matrix[s:s + _BLOCK_ROWS], dtype=np.float32)
+        scores = np.concatenate([best_scores, Q @ block.T], axis=1)
+        rows = np.concatenate([best_rows, np.broadcast_to(np.arange(s, s + len(block)), (len(Q), len(block)))], axis=1)
+        idx = np.argpartition(-scores, keep - 1, axis=1)[:, :keep]
+        best_scores = np.take_along_axis(scores, idx, axis=1)
+        best_rows = np.take_along_axis(rows, idx, axis=1)
+    order = np.argsort(-best_scores, axis=1, kind="stable")
+
+    blob = "\n".join(f"{r}\t{o}" for r, o in pairs).encode("utf-8")
+    return {
+        "pain_keys": np.frombuffer(blob, dtype=np.uint8),
+        "pain_vecs": Q,
+        "pain_rows": np.take_along_axis(best_rows, order, axis=1).astype(np.int64),
+        "pain_scores": np.take_along_axis(best_scores, order, axis=1).astype(np.float32),
+    }
+
+# -------------------------
+# Lookup
+# -------------------------
+class PainTable:
+    """Query-side view over the (memory-mapped) arrays of one index."""
+    def __init__(self, arrays: Dict):
+        self._arrays = arrays
+        blob = bytes(arrays["pain_keys"]).decode("utf-8")
+        self.keys: Dict[Tuple[str, str], int] = {}
+        for i, line in enumerate(blob.split("\n") if blob else []):
+            role, _, option = line.partition("\t")
+            self.keys[(role, option)] = i
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @property
+    def rows(self):
+        """[K, N] stored row ids."""
+        return self._arrays["pain_rows"]
+
+    @property
+    def top_n(self) -> int:
+        return int(self.rows.shape[1])
+
+    def lookup(self, role: str, options: List[str], top_k: int, exact_rows, q=None) -> Optional[Tuple]:
+        """
+        (row ids, scores) best first for the pain query of `role` and
+        `options`, or None if any of them is not in the table. `exact_rows`
+        reads float32 index rows (vectors.Vectors.exact_rows) for re-ranking
+        against `q`, the embedded query if available.
+        """
+        import numpy as np
+
+        role = role.strip().lower()
+        opts = sorted(set(options))
+        ids = [self.keys.get((role, o)) for o in opts or [""]]
+        if any(i is None for i in ids):
+            return None
+        if len(ids) == 1:
+            k = min(top_k, self.top_n)
+            return (np.asarray(self.rows[ids[0], :k], dtype=np.int64),
+                    np.asarray(self._arrays["pain_scores"][ids[0], :k], dtype=np.float32))
+
+        if q is None:
+            q = np.asarray(self._arrays["pain_vecs"][ids], dtype=np.float32).mean(axis=0)
+        q = np.asarray(q, dtype=np.float32)
+        q = q / max(float(np.linalg.norm(q)), 1e-8)
+        cand = np.unique(np.asarray(self.rows[ids], dtype=np.int64))
+        scores = exact_rows(cand) @ q
+        order = np.argsort(-scores, kind="stable")[:top_k]
+        return cand[order], scores[order].astype(np.float32)
@@ -0,0 +1,25 @@
+# backend/question_bank.py
+"""
+Fixed survey questions used when OpenAI is unavailable. Their MCQ options
+are also the closed vocabulary /analyze builds its pain query from, which
+ingest precomputes retrieval for (see pain_index.py).
+"""
+from typing import List, Optional, Tuple
+
+# (prompt, options or None for a 1–5 Likert item, multi-select)
+FALLBACK_BANK: List[Tuple[str, Optional[List[str]], bool]] = [
+    ("Which challenges apply today?", ["Stockouts", "Overstock", "Slow turns", "Supplier delays", "Data silos"], True),
+    ("What best describes your inventory process?", ["Manual spreadsheets", "Basic POS", "ERP-lite", "Full ERP (APIs)"], False),
+    ("Which channels do you sell on?", ["Offline retail", "Own website", "Marketplaces", "Social commerce", "B2B"], True),
+    ("Your current demand forecasting maturity?", ["None", "Simple moving avg", "Seasonality aware", "ML models"], False),
+    ("Which integrations do you already use?", ["Tally/Zoho", "Shopify", "Woo", "SAP/Oracle", "Custom DB"], True),
+    ("Supplier reliability (OTD) meets targets.", None, False),
+    ("We can trace inventory at batch/lot level.", None, False),
+    ("Our lead-time variability is under control.", None, False),
+    ("We have ABC/XYZ classification live.", None, False),
+    ("Replenishment is automated for top SKUs.", None, False),
+]
+
+def mcq_options() -> List[str]:
+    """Every MCQ option in the bank, in bank order, without duplicates."""
+    return list(dict.fromkeys(o for _, opts, _ in FALLBACK_BANK for o in (opts or [])))
@@ -0,0 +1,301 @@
+"""
+Ingest and search micro-benchmarks over synthetic corpora.
+
+    python scripts/bench.py                               # 1k, 10k, 100k, 1M chunks
+    python scripts/bench.py --sizes 1k,10k --out bench.json
+    python scripts/bench.py --embed local --queries 500
+
+Every corpus size runs in its own subprocess against a scratch DATA_DIR /
+DOCS_DIR, so peak RSS is per size and nothing touches backend/data. With
+--embed standin (the default), chunks and queries are embedded through
+scripts/openai_standin.py on a local port; --embed local uses the hashed
+TF-IDF embedder.
+
+Measured per size:
+  ingest   wall time, chunks/s, MB/s of text
+  index    bytes on disk per file kind, cold open time
+  search   p50/p95/p99/mean latency per mode (dense, hybrid, lexical),
+           end to end including the query embedding; dense_cached repeats
+           dense with the query embeddings cached (scoring only). Plus
+           batch throughput of search_chunks_many
+  rss      peak RSS of the benchmark process and of its extraction workers
+plus a size-independent pass over _split_text and text_utils.chunk_text.
+
+Results are one JSON document (sorted keys, stable layout) so runs from two
+commits can be diffed directly.
+"""
+import os, sys, json, time, shutil, platform, resource, subprocess, tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCHEMA = "gsos-bench/1"
+CHUNKS_PER_FILE = 200
+VOCAB_SIZE = 20000
+
+def _parse_size(s: str) -> int:
+    s = s.strip().lower()
+    mult = {"k": 1_000, "m": 1_000_000}.get(s[-1:], 1)
+    return int(float(s.rstrip("km")) * mult)
+
+def _percentiles(samples_ms):
+    import numpy as np
+
+    a = np.asarray(samples_ms, dtype=np.float64)
+    p50, p95, p99 = np.percentile(a, [50, 95, 99])
+    return {"n": len(a), "p50_ms": round(p50, 3), "p95_ms": round(p95, 3),
+            "p99_ms": round(p99, 3), "mean_ms": round(float(a.mean()), 3)}
+
+def _peak_rss_mb(who=resource.RUSAGE_SELF) -> float:
+    return round(resource.getrusage(who).ru_maxrss / 1024.0, 1)   # ru_maxrss is KiB on Linux
+
+# -------------------------
+# Synthetic corpus
+# -------------------------
+def _vocab():
+    import numpy as np
+
+    rng = np.random.default_rng(7)
+    letters = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+    lengths = rng.integers(3, 11, size=VOCAB_SIZE)
+    return ["".join(rng.choice(letters, n)) for n in lengths]
+
+def _words(rng, vocab, n: int):
+    """n Zipf-distributed words, so term frequencies look like real text."""
+    import numpy as np
+
+    ids = np.minimum(rng.zipf(1.15, size=n), len(vocab)) - 1
+    return [vocab[i] for i in ids]
+
+def _synthetic_text(rng, vocab, chars: int) -> str:
+    words = _words(rng, vocab, chars // 6 + 1)
+    paras, out, size = [], [], 0
+    for w in words:
+        out.append(w)
+        size += len(w) + 1
+        if len(out) >= 80:
+            paras.append(" ".join(out) + ".")
+            out = []
+        if size >= chars:
+            break
+    if out:
+        paras.append(" ".join(out) + ".")
+    return "\n\n".join(paras)
+
+def _write_corpus(docs_dir: str, chunks: int, chunk_size: int, overlap: int) -> int:
+    """Write .txt files that split into about `chunks` chunks; returns bytes written."""
+    import numpy as np
+
+    rng = np.random.default_rng(chunks)
+    vocab = _vocab()
+    step = chunk_size - overlap
+    written, remaining, i = 0, chunks, 0
+    os.makedirs(docs_dir, exist_ok=True)
+    while remaining > 0:
+        n = min(CHUNKS_PER_FILE, remaining)
+        text = _synthetic_text(rng, vocab, max(1, (n - 1) * step + 1))
+        path = os.path.join(docs_dir, f"doc_{i:06d}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        written += len(text.encode("utf-8"))
+        remaining -= n
+        i += 1
+    return written
+
+def _queries(n: int):
+    import numpy as np
+
+    rng = np.random.default_rng(1234)
+    vocab = _vocab()
+    return [" ".join(_words(rng, vocab, int(rng.integers(3, 7)))) for _ in range(n)]
+
+# -------------------------
+# Stages (run in a child process)
+# -------------------------
+def _start_standin(dim: int) -> None:
+    sys.path.insert(0, os.path.join(BACKEND_DIR, "scripts"))
+    import openai_standin
+
+    server = openai_standin.serve(0, dim)
+    os.environ.update(
+        OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY") or "bench",
+        OPENAI_BASE_URL=f"http://127.0.0.1:{server.server_address[1]}/v1",
+        FORCE_OPENAI="true",
+    )
+
+def _run_micro(args) -> dict:
+    import numpy as np
+
+    sys.path.insert(0, BACKEND_DIR)
+    from search import _split_text
+    from text_utils import chunk_text
+
+    text = _synthetic_text(np.random.default_rng(0), _vocab(), 2_000_000)
+    mb = len(text.encode("utf-8")) / 1e6
+    out = {"text_mb": round(mb, 3)}
+    for name, fn in (("split_text", _split_text), ("chunk_text", chunk_text)):
+        best = float("inf")
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            n = len(fn(text))
+            best = min(best, time.perf_counter() - t0)
+        out[name] = {"chunks": n, "best_s": round(best, 4), "mb_per_s": round(mb / best, 2)}
+    return out
+
+def _run_size(args, chunks: int) -> dict:
+    work = tempfile.mkdtemp(prefix="gsos-bench-")
+    try:
+        docs_dir, data_dir = os.path.join(work, "docs"), os.path.join(work, "data")
+        os.environ.update(DOCS_DIR=docs_dir, DATA_DIR=data_dir)
+        if args.embed == "standin":
+            _start_standin(args.dim)
+        else:
+            os.environ.pop("FORCE_OPENAI", None)
+
+        sys.path.insert(0, BACKEND_DIR)
+        import search, index_store
+
+        t0 = time.perf_counter()
+        text_bytes = _write_corpus(docs_dir, chunks, search.CHUNK_SIZE, search.CHUNK_OVERLAP)
+        gen_s = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        payload = search.ingest_docs_to_json()
+        ingest_s = time.perf_counter() - t0
+        meta = payload["meta"]
+        rss_after_ingest = _peak_rss_mb()
+
+        prefix = os.path.basename(search.INDEX_BASE) + "."
+        gen = f"{index_store.read_header(search.INDEX_BASE)['generation']}."
+        by_kind = {}
+        for p in index_store.bundle_files(search.INDEX_BASE):
+            kind = os.path.basename(p)[len(prefix):]
+            kind = kind[len(gen):] if kind.startswith(gen) else kind
+            by_kind[kind] = by_kind.get(kind, 0) + os.path.getsize(p)
+
+        t0 = time.perf_counter()
+        search.ChunkIndex(search.INDEX_BASE).get()
+        open_s = time.perf_counter() - t0
+
+        queries = _queries(args.queries + args.warmup)
+        latency = {}
+        # dense_cached repeats the dense pass right after it, so every query
+        # embedding is already in the cache.
+        for mode in ("dense", "dense_cached", "hybrid", "lexical"):
+            if mode != "dense_cached":
+                search.QUERY_EMBEDDINGS.clear()
+            samples = []
+            for i, q in enumerate(queries):
+                t0 = time.perf_counter()
+                search.search_chunks(q, args.top_k, mode=mode.replace("_cached", ""))
+                if i >= args.warmup:
+                    samples.append((time.perf_counter() - t0) * 1000)
+            latency[mode] = _percentiles(samples)
+
+        batch = _queries(args.batch)
+        search.search_chunks_many(batch[:8], args.top_k)       # warm
+        t0 = time.perf_counter()
+        search.search_chunks_many(batch, args.top_k)
+        batch_s = time.perf_counter() - t0
+
+        return {
+            "chunks": meta["count"],
+            "files": len(meta.get("files", {})),
+            "embed_backend": meta.get("embed_backend"),
+            "dim": int(search.get_index().dim or 0),
+            "corpus_mb": round(text_bytes / 1e6, 3),
+            "corpus_gen_s": round(gen_s, 3),
+            "ingest": {
+                "seconds": round(ingest_s, 3),
+                "chunks_per_s": round(meta["count"] / ingest_s, 1) if ingest_s else None,
+                "mb_per_s": round(text_bytes / 1e6 / ingest_s, 3) if ingest_s else None,
+            },
+            "index": {
+                "bytes": sum(by_kind.values()),
+                "bytes_by_kind": by_kind,
+                "open_s": round(open_s, 4),
+                "ann": meta.get("ann"),
+                "storage": meta.get("storage"),
+            },
+            "search": latency,
+            "batch_search": {
+                "queries": len(batch),
+                "seconds": round(batch_s, 3),
+                "queries_per_s": round(len(batch) / batch_s, 1) if batch_s else None,
+            },
+            "rss_mb": {
+                "peak_after_ingest": rss_after_ingest,
+                "peak": _peak_rss_mb(),
+                "peak_workers": _peak_rss_mb(resource.RUSAGE_CHILDREN),
+            },
+        }
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+# -------------------------
+# Driver
+# -------------------------
+def _child(args, stage: str) -> dict:
+    cmd = [sys.executable, os.path.abspath(__file__), "--stage", stage,
+           "--embed", args.embed, "--dim", str(args.dim), "--queries", str(args.queries),
+           "--warmup", str(args.warmup), "--batch", str(args.batch), "--top-k", str(args.top_k),
+           "--repeat", str(args.repeat)]
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, text=True, cwd=BACKEND_DIR)
+    if proc.returncode != 0:
+        return {"error": f"exit {proc.returncode}"}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark ingest and search on synthetic corpora.")
+    parser.add_argument("--sizes", default="1k,10k,100k,1m", help="Comma-separated chunk counts (k/m suffixes)")
+    parser.add_argument("--embed", choices=["standin", "local"], default="standin")
+    parser.add_argument("--dim", type=int, default=256, help="Stand-in embedding dimension")
+    parser.add_argument("--queries", type=int, default=200, help="Timed queries per search mode")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=256, help="Queries in the batch-search pass")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3, help="Repeats of the chunking micro-benchmark")
+    parser.add_argument("--out", help="Write JSON here instead of stdout")
+    parser.add_argument("--stage", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.stage:
+        # Child: silence the app log so stdout carries only the JSON line.
+        from loguru import logger
+        logger.remove()
+        logger.add(sys.stderr, level="WARNING")
+        result = _run_micro(args) if args.stage == "micro" else _run_size(args, int(args.stage))
+        print(json.dumps(result, sort_keys=True))
+        return
+
+    import numpy as np
+    report = {
+        "schema": SCHEMA,
+        "commit": _git_commit(),
+        "created_at": int(time.time()),
+        "env": {"python": platform.python_version(), "numpy": np.__version__,
+                "platform": platform.platform(), "cpus": os.cpu_count()},
+        "params": {k: v for k, v in vars(args).items() if k not in ("out", "stage")},
+        "micro": _child(args, "micro"),
+        "sizes": {},
+    }
+    for size in [_parse_size(s) for s in args.sizes.split(",") if s.strip()]:
+        print(f"[bench] {size} chunks ...", file=sys.stderr, flush=True)
+        report["sizes"][str(size)] = _child(args, str(size))
+
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"[bench] wrote {args.out}", file=sys.stderr)
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
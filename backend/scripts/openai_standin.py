@@ -0,0 +1,137 @@
+"""
+Local stand-in for the OpenAI embeddings and chat completions APIs, for
+exercising the ingest, search and answer paths (and their retry logic)
+without network access or spend.
+
+    python scripts/openai_standin.py --port 8765 --dim 1536 --fail-every 3
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=x FORCE_OPENAI=true \
+        python scripts/reingest.py
+
+Vectors are deterministic per input text; chat completions return a canned
+answer (a JSON survey when response_format is json_object). --fail-every N
+answers every Nth embeddings request with 429 + retry-after-ms, so client
+retries can be observed.
+"""
+import json, time, hashlib, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+def embed(text: str, dim: int):
+    import numpy as np
+
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    v = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return (v / max(float(np.linalg.norm(v)), 1e-8)).tolist()
+
+def make_handler(dim: int, fail_every: int, latency_ms: float):
+    counter = {"n": 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _send(self, code: int, body: dict, headers: dict | None = None):
+            raw = json.dumps(body).encode("utf-8")
+            self.send_response(code)
+            self.send_header("content-type", "application/json")
+            self.send_header("content-length", str(len(raw)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def _chat(self, req: dict):
+            if latency_ms:
+                time.sleep(latency_ms / 1000.0)
+            if (req.get("response_format") or {}).get("type") == "json_object":
+                content = json.dumps({"questions": [
+                    {"id": f"q{i}", "type": "likert", "prompt": f"Stand-in question {i}", "min": 1, "max": 5}
+                    for i in range(11)
+                ] + [{"id": "q_open", "type": "short_text", "prompt": "Stand-in open question"}]})
+            else:
+                content = "Stand-in answer grounded in the supplied context."
+            if req.get("stream"):
+                return self._stream(req, content)
+            self._send(200, {
+                "id": "chatcmpl-standin",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": req.get("model"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            })
+
+        def _stream(self, req: dict, content: str):
+            self.send_response(200)
+            self.send_header("content-type", "text/event-stream")
+            self.end_headers()
+            for word in content.split(" "):
+                chunk = {
+                    "id": "chatcmpl-standin",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": req.get("model"),
+                    "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}],
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                if latency_ms:
+                    time.sleep(latency_ms / 1000.0 / 10)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+            self.close_connection = True
+
+        def do_POST(self):
+            length = int(self.headers.get("content-length") or 0)
+            req = json.loads(self.rfile.read(length) or b"{}")
+            if self.path.rstrip("/").endswith("/chat/completions"):
+                return self._chat(req)
+            if not self.path.rstrip("/").endswith("/embeddings"):
+                return self._send(404, {"error": {"message": "not found"}})
+
+            with lock:
+                counter["n"] += 1
+                n = counter["n"]
+            if fail_every and n % fail_every == 0:
+                return self._send(429, {"error": {"message": "rate limited", "type": "rate_limit"}},
+                                  {"retry-after-ms": "50"})
+            if latency_ms:
+                time.sleep(latency_ms / 1000.0)
+
+            inputs = req.get("input") or []
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            data = [{"object": "embedding", "index": i, "embedding": embed(t, dim)} for i, t in enumerate(inputs)]
+            tokens = sum(max(1, len(t) // 4) for t in inputs)
+            self._send(200, {
+                "object": "list",
+                "data": data,
+                "model": req.get("model"),
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+            })
+
+    return Handler
+
+def serve(port: int = 8765, dim: int = 1536, fail_every: int = 0, latency_ms: float = 0.0) -> ThreadingHTTPServer:
+    """Start the stand-in on a background thread and return the server."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(dim, fail_every, latency_ms))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI embeddings and chat APIs.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--fail-every", type=int, default=0, help="Answer every Nth request with 429")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Artificial latency per request")
+    args = parser.parse_args()
+
+    server = serve(args.port, args.dim, args.fail_every, args.latency_ms)
+    print(f"Stand-in OpenAI API on http://127.0.0.1:{args.port}/v1 (dim={args.dim})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -5,7 +5,7 @@ from search import ingest_docs_to_json
 
 if __name__ == "__main__":
     import argparse
-    parser = argparse.ArgumentParser(description="Reingest GSOS docs into JSON index.")
+    parser = argparse.ArgumentParser(description="Reingest GSOS docs into the binary chunk index.")
     parser.add_argument("--only-file", type=str, help="Specific filename in backend/docs")
     parser.add_argument("--force-openai", action="store_true", help="Force using OpenAI embeddings")
     args = parser.parse_args()
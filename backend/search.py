@@ -1,16 +1,49 @@
-import os, json, time
-from typing import List, Tuple, Dict
+import os, json, time, shutil, tempfile, threading, hashlib, signal, fnmatch
+from typing import List, Tuple, Dict, Optional, Callable, Iterable, Iterator
 from loguru import logger
 
+import index_store
+import ann
+import embed_cache
+import local_embed
+import bm25
+import metrics
+import vectors
+import pain_index
+from caching import TTLCache
+
 # -------------------------
 # Config via ENV
 # -------------------------
 OPENAI_EMBED_MODEL   = os.getenv("OPENAI_EMBED_MODEL", "text-embedding-3-small")
 ITEM_TOKEN_CAP       = int(os.getenv("EMBED_ITEM_TOKEN_CAP", "8000"))
 REQ_TOKEN_BUDGET     = int(os.getenv("EMBED_REQ_TOKEN_BUDGET", "200000"))
+REQ_MAX_ITEMS        = int(os.getenv("EMBED_REQ_MAX_ITEMS", "2048"))   # API limit on inputs per request
+EMBED_CONCURRENCY    = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_MAX_RETRIES    = int(os.getenv("EMBED_MAX_RETRIES", "6"))
+EMBED_BACKOFF_BASE   = float(os.getenv("EMBED_BACKOFF_BASE", "0.5"))  # seconds
+EMBED_BACKOFF_MAX    = float(os.getenv("EMBED_BACKOFF_MAX", "30"))
+QUERY_EMBED_TIMEOUT  = float(os.getenv("QUERY_EMBED_TIMEOUT", "5"))   # seconds per attempt
+QUERY_EMBED_RETRIES  = int(os.getenv("QUERY_EMBED_RETRIES", "1"))
+QUERY_EMBED_BACKOFF_MAX = float(os.getenv("QUERY_EMBED_BACKOFF_MAX", "0.5"))  # seconds; queries fail fast to lexical
+
+SEARCH_MODE          = os.getenv("SEARCH_MODE", "dense").lower()   # dense | hybrid | lexical
+HYBRID_CANDIDATES    = int(os.getenv("HYBRID_CANDIDATES", "50"))  # per retriever, before fusion
+BATCH_SCORE_BUDGET   = int(os.getenv("BATCH_SCORE_BUDGET", str(64 * 1024 * 1024)))  # score cells per block
+
+QUERY_EMBED_CACHE_SIZE = int(os.getenv("QUERY_EMBED_CACHE_SIZE", "4096"))
+QUERY_EMBED_CACHE_TTL  = float(os.getenv("QUERY_EMBED_CACHE_TTL", "86400"))  # seconds
+INDEX_STAT_INTERVAL    = float(os.getenv("INDEX_STAT_INTERVAL", "2"))  # seconds between header stat() checks
 
-DATA_PATH = os.path.join(os.path.dirname(__file__), "data", "gsos_chunks.json")
-DOCS_DIR  = os.path.join(os.path.dirname(__file__), "docs")
+INGEST_WORKERS       = int(os.getenv("INGEST_WORKERS", str(min(4, os.cpu_count() or 1))))
+INGEST_FILE_TIMEOUT  = int(os.getenv("INGEST_FILE_TIMEOUT", "300"))  # seconds per file
+INGEST_BATCH         = int(os.getenv("INGEST_BATCH", "512"))          # rows embedded + appended at a time
+
+DATA_DIR   = os.getenv("DATA_DIR", os.path.join(os.path.dirname(__file__), "data"))
+DATA_PATH  = os.path.join(DATA_DIR, "gsos_chunks.json")  # legacy JSON index
+INDEX_BASE = os.path.splitext(DATA_PATH)[0]
+INDEX_PATH = index_store.header_path(INDEX_BASE)
+DOCS_DIR   = os.getenv("DOCS_DIR", os.path.join(os.path.dirname(__file__), "docs"))
 
 # -------------------------
 # Simple text splitter
@@ -38,17 +71,100 @@ def _truncate_to_tokens_approx(text: str, max_tokens: int) -> str:
     limit = max_tokens * 4
     return text if len(text) <= limit else text[:limit]
 
+_client = None
+_client_lock = threading.Lock()
+
+def _openai_client():
+    """
+    One shared, thread-safe OpenAI client (and connection pool) per process.
+    Retries are handled in _embed_batch, so the SDK's own are disabled.
+    OPENAI_BASE_URL points it at a local stand-in server for tests.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from openai import OpenAI
+                _client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+    return _client
+
+def _parse_reset(value: str) -> Optional[float]:
+    """Seconds from rate-limit headers: '20ms', '1.5s', '6m0s', or plain seconds."""
+    import re
+
+    value = (value or "").strip()
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    units = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+    parts = re.findall(r"([\d.]+)(ms|s|m|h)", value)
+    return sum(float(n) * units[u] for n, u in parts) if parts else None
+
+def _retry_delay(err: Exception, attempt: int) -> Optional[float]:
+    """
+    Delay before retrying `err`, or None if it is not retryable. Honours
+    retry-after(-ms) and x-ratelimit-reset-* headers, else exponential
+    backoff with jitter.
+    """
+    import random
+    import openai
+
+    if isinstance(err, openai.APIStatusError):
+        if err.status_code not in (408, 409, 429) and err.status_code < 500:
+            return None
+        headers = err.response.headers
+        hinted = None
+        if headers.get("retry-after-ms"):
+            hinted = _parse_reset(headers["retry-after-ms"])
+            hinted = hinted / 1000.0 if hinted is not None else None
+        for name in ("retry-after", "x-ratelimit-reset-tokens", "x-ratelimit-reset-requests"):
+            if hinted is None and headers.get(name):
+                hinted = _parse_reset(headers[name])
+        if hinted is not None:
+            return min(max(hinted, 0.0), EMBED_BACKOFF_MAX)
+    elif not isinstance(err, (openai.APIConnectionError, openai.APITimeoutError)):
+        return None
+    backoff = EMBED_BACKOFF_BASE * (2 ** attempt)
+    return min(backoff, EMBED_BACKOFF_MAX) * (0.5 + random.random() / 2)
+
+def _embed_batch(client, model: str, batch: List[str], label: str,
+                 retries: int = EMBED_MAX_RETRIES, max_delay: float = EMBED_BACKOFF_MAX) -> List[List[float]]:
+    for attempt in range(retries + 1):
+        try:
+            rsp = client.embeddings.create(model=model, input=batch)
+            return [d.embedding for d in sorted(rsp.data, key=lambda d: d.index)]
+        except Exception as e:
+            delay = _retry_delay(e, attempt)
+            if delay is None or attempt == retries:
+                raise
+            delay = min(delay, max_delay)
+            logger.warning(f"Embedding batch {label} failed ({e.__class__.__name__}); retry {attempt + 1} in {delay:.2f}s")
+            metrics.EMBED_RETRIES.inc(reason=e.__class__.__name__)
+            time.sleep(delay)
+
 def _embed_openai(
     texts: List[str],
     model: str = OPENAI_EMBED_MODEL,
     per_item_token_cap: int = ITEM_TOKEN_CAP,
     max_tokens_per_request: int = REQ_TOKEN_BUDGET,
+    concurrency: int = EMBED_CONCURRENCY,
+    retries: int = EMBED_MAX_RETRIES,
+    timeout: Optional[float] = None,
+    max_delay: float = EMBED_BACKOFF_MAX,
 ) -> List[List[float]]:
     """
     Batched embeddings with per-item truncation and request-level token budget.
+    Batches go out concurrently on the shared client; each one retries on its
+    own (rate limits, 5xx, connection errors), and results keep input order.
+    `retries`, `timeout` (per request) and `max_delay` (between retries)
+    default to the ingest policy.
     """
-    from openai import OpenAI
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    client = _openai_client()
+    if timeout:
+        client = client.with_options(timeout=timeout)
 
     # 1. truncate
     safe_texts = [_truncate_to_tokens_approx(t, per_item_token_cap) for t in texts]
@@ -57,7 +173,8 @@ def _embed_openai(
     batches, current_batch, current_tokens = [], [], 0
     for t in safe_texts:
         t_tokens = _estimate_tokens_by_chars(t)
-        if current_batch and (current_tokens + t_tokens) > max_tokens_per_request:
+        if current_batch and ((current_tokens + t_tokens) > max_tokens_per_request
+                              or len(current_batch) >= REQ_MAX_ITEMS):
             batches.append(current_batch)
             current_batch, current_tokens = [t], t_tokens
         else:
@@ -67,16 +184,24 @@ def _embed_openai(
         batches.append(current_batch)
 
     # 3. call API
+    labels = [f"{i}/{len(batches)}" for i in range(1, len(batches) + 1)]
+    for label, batch in zip(labels, batches):
+        logger.info(f"Embedding batch {label} with {len(batch)} items")
+    if len(batches) <= 1 or concurrency <= 1:
+        results = [_embed_batch(client, model, b, l, retries, max_delay) for b, l in zip(batches, labels)]
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(batches))) as pool:
+            results = list(pool.map(lambda bl: _embed_batch(client, model, *bl, retries, max_delay), zip(batches, labels)))
+
     out: List[List[float]] = []
-    for i, batch in enumerate(batches, 1):
-        logger.info(f"Embedding batch {i}/{len(batches)} with {len(batch)} items")
-        rsp = client.embeddings.create(model=model, input=batch)
-        out.extend([d.embedding for d in rsp.data])
+    for res in results:
+        out.extend(res)
     return out
 
-def _embed_local(texts: List[str]) -> List[List[float]]:
-    import hashlib
-    return [[(int(hashlib.sha256(t.encode()).hexdigest(), 16) % 1000) / 1000.0 for _ in range(10)] for t in texts]
+def _embed_local(texts: List[str], idf=None, dim: int = local_embed.LOCAL_EMBED_DIM):
+    """Hashed TF-IDF vectors (see local_embed); `idf` comes from the index."""
+    return local_embed.embed(texts, idf=idf, dim=dim)
 
 def _embed_texts(texts: List[str], force_openai: bool = False) -> Tuple[List[List[float]], str]:
     if os.getenv("OPENAI_API_KEY") and (force_openai or os.getenv("FORCE_OPENAI") == "true"):
@@ -90,164 +215,1071 @@ def _embed_texts(texts: List[str], force_openai: bool = False) -> Tuple[List[Lis
 # -------------------------
 # Ingest pipeline (drop-in)
 # -------------------------
-def ingest_docs_to_json(only_file: str | None = None, force_openai: bool = False) -> Dict:
+SUPPORTED_EXT = {".docx", ".pdf", ".txt", ".md", ".html", ".htm"}
+_TEXT_BLOCK = 1 << 20   # characters read at a time from plain-text files
+
+def _gather_files() -> List[str]:
+    files: list[str] = []
+    for root, _, fnames in os.walk(DOCS_DIR):
+        for fn in fnames:
+            if os.path.splitext(fn)[1].lower() in SUPPORTED_EXT:
+                files.append(os.path.join(root, fn))
+    return sorted(files)
+
+def _source_name(abs_path: str) -> str:
+    """Path relative to DOCS_DIR with "/" separators: a file's source_path and meta.files key."""
+    return os.path.relpath(abs_path, DOCS_DIR).replace(os.sep, "/")
+
+def _file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def _iter_text(abs_path: str) -> Iterator[str]:
+    """
+    A file's text piece by piece: PDF pages, DOCX paragraphs, or fixed-size
+    blocks of plain text. The pieces concatenate to the full text, so only
+    one page (or block) needs to be in memory at a time.
+    """
+    ext = os.path.splitext(abs_path)[1].lower()
+    if ext == ".docx":
+        import docx
+        doc = docx.Document(abs_path)
+        first = True
+        for p in doc.paragraphs:
+            if p.text.strip():
+                yield p.text if first else "\n" + p.text
+                first = False
+    elif ext == ".pdf":
+        from PyPDF2 import PdfReader
+        reader = PdfReader(abs_path)
+        for i, page in enumerate(reader.pages):
+            try:
+                text = page.extract_text() or ""
+            except Exception:
+                text = ""
+            yield text if i == 0 else "\n" + text
+    elif ext in {".txt", ".md", ".html", ".htm"}:
+        with open(abs_path, "r", encoding="utf-8", errors="ignore") as f:
+            for block in iter(lambda: f.read(_TEXT_BLOCK), ""):
+                yield block
+
+def _split_stream(pieces: Iterable[str], chunk_size: int = CHUNK_SIZE,
+                  overlap: int = CHUNK_OVERLAP) -> Iterator[str]:
+    """
+    _split_text over a stream of text pieces: yields exactly the chunks
+    _split_text would for their concatenation, buffering at most one piece
+    plus one chunk.
+    """
+    step = chunk_size - overlap
+    buf, buf_start, start = "", 0, 0     # buf holds text[buf_start:]
+    for piece in pieces:
+        buf += piece
+        while start + chunk_size <= buf_start + len(buf):
+            yield buf[start - buf_start:start - buf_start + chunk_size]
+            start += step
+        drop = start - buf_start
+        if drop > 0:
+            buf, buf_start = buf[drop:], start
+    while start < buf_start + len(buf):
+        yield buf[start - buf_start:start - buf_start + chunk_size]
+        start += step
+
+def _iter_file_records(abs_path: str, timings: Optional[Dict] = None) -> Iterator[Dict]:
+    """Chunk records of one file, streamed; `timings` accumulates extract/chunk seconds."""
+    fn = _source_name(abs_path)
+    pieces = _iter_text(abs_path)
+    if timings is not None:
+        pieces = _timed_pieces(pieces, timings)
+    t0 = time.perf_counter()
+    for i, chunk in enumerate(_split_stream(pieces)):
+        ch = chunk.strip()
+        if ch:
+            yield {"source_path": fn, "chunk_index": i, "text": ch}
+    if timings is not None:
+        timings["chunk"] = max(0.0, time.perf_counter() - t0 - timings.get("extract", 0.0))
+
+def _timed_pieces(pieces: Iterator[str], timings: Dict) -> Iterator[str]:
+    timings.setdefault("extract", 0.0)
+    while True:
+        t0 = time.perf_counter()
+        try:
+            piece = next(pieces)
+        except StopIteration:
+            return
+        finally:
+            timings["extract"] += time.perf_counter() - t0
+        yield piece
+
+def _spill_file(abs_path: str, out_path: str, timings: Optional[Dict] = None) -> int:
+    """
+    Extract + chunk one file into a JSON-lines spill file. Returns the
+    number of records; a file that fails to read yields none.
+    """
+    fn = os.path.basename(abs_path)
+    n = 0
+    try:
+        with open(out_path, "w", encoding="utf-8") as f:
+            for rec in _iter_file_records(abs_path, timings):
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                n += 1
+    except Exception as e:
+        logger.error(f"Failed to read {fn}: {e}")
+        n = 0
+    if not n:
+        if os.path.exists(out_path):
+            os.remove(out_path)
+        logger.warning(f"Empty or unreadable content in {fn}; skipping.")
+    return n
+
+def _spill_file_timed(abs_path: str, out_path: str, timeout: int = INGEST_FILE_TIMEOUT) -> Tuple[int, Dict]:
+    """
+    _spill_file under a per-file alarm, so one malformed PDF cannot stall a
+    worker. Returns (record count, stage timings) for the parent to record.
+    """
+    timings: Dict = {}
+    if not timeout or not hasattr(signal, "SIGALRM"):
+        return _spill_file(abs_path, out_path, timings), timings
+
+    def _expired(signum, frame):
+        raise TimeoutError(f"extraction exceeded {timeout}s")
+
+    prev = signal.signal(signal.SIGALRM, _expired)
+    signal.alarm(timeout)
+    try:
+        return _spill_file(abs_path, out_path, timings), timings
+    finally:
+        signal.alarm(0)
+        signal.signal(signal.SIGALRM, prev)
+
+def _observe_file_stages(timings: Dict) -> None:
+    for stage, seconds in timings.items():
+        metrics.INGEST_STAGE.observe(seconds, stage=stage, backend="-")
+
+def _read_spill(path: str) -> Iterator[Dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
+
+def _chunk_files(paths: List[str], spill_dir: str, workers: int = INGEST_WORKERS,
+                 timeout: int = INGEST_FILE_TIMEOUT,
+                 progress: Optional[Callable] = None) -> List[Tuple[str, int]]:
+    """
+    Extract + chunk files on a process pool, each into its own spill file
+    under `spill_dir`. Returns (spill path, record count) in `paths` order;
+    records are identical to a serial run. A file that times out or crashes
+    its worker yields no records.
+
+    Files are extracted in-process only when there is no timeout: ingest
+    runs off the main thread, where SIGALRM cannot be used, so even a single
+    file goes to a (one-process) pool to keep the per-file timeout.
+    """
+    progress = progress or (lambda *a: None)
+    if not paths:
+        return []
+    spills = [os.path.join(spill_dir, f"{i:06d}.jsonl") for i in range(len(paths))]
+    workers = max(1, min(workers, len(paths)))
+    if workers == 1 and not timeout:
+        out = []
+        for i, (p, spill) in enumerate(zip(paths, spills), 1):
+            timings: Dict = {}
+            out.append((spill, _spill_file(p, spill, timings)))
+            _observe_file_stages(timings)
+            progress("extract", i, len(paths))
+        return out
+
+    import math
+    import multiprocessing as mp
+
+    # Safety net above the in-worker alarm, for extraction stuck in C code.
+    deadline = time.monotonic() + (timeout or 3600) * math.ceil(len(paths) / workers) + 30
+    out: List[Tuple[str, int]] = []
+    pool = mp.get_context("spawn").Pool(processes=workers)
+    try:
+        pending = [pool.apply_async(_spill_file_timed, (p, spill, timeout)) for p, spill in zip(paths, spills)]
+        for path, spill, res in zip(paths, spills, pending):
+            try:
+                n, timings = res.get(timeout=max(0.0, deadline - time.monotonic()))
+                _observe_file_stages(timings)
+            except mp.TimeoutError:
+                logger.error(f"Timed out extracting {os.path.basename(path)}; skipping.")
+                n = 0
+            except Exception as e:
+                logger.error(f"Failed to extract {os.path.basename(path)}: {e}")
+                n = 0
+            out.append((spill, n))
+            progress("extract", len(out), len(paths))
+    finally:
+        pool.terminate()
+        pool.join()
+    return out
+
+def _target_backend(force_openai: bool) -> str:
+    if os.getenv("OPENAI_API_KEY") and (force_openai or os.getenv("FORCE_OPENAI") == "true"):
+        return "openai"
+    return "local"
+
+def _embed_with_cache(texts: List[str], force_openai: bool = False) -> Tuple[List[List[float]], str, int, int]:
+    """
+    Embed texts through the persistent (text hash, model) cache; only misses
+    go to the embedding backend. Returns (embeddings, backend, hits, misses).
+    """
+    backend = _target_backend(force_openai)
+    model_key = OPENAI_EMBED_MODEL if backend == "openai" else "local"
+    hashes = [embed_cache.text_hash(t) for t in texts]
+    cached = embed_cache.get_many(hashes, model_key)
+
+    missing: Dict[str, str] = {}
+    for h, t in zip(hashes, texts):
+        if h not in cached:
+            missing.setdefault(h, t)
+    if missing:
+        fresh, got = _embed_texts(list(missing.values()), force_openai=force_openai)
+        if got != backend:
+            # The backend fell back mid-run; cached vectors would not mix.
+            return _embed_local(texts), got, 0, len(texts)
+        fresh_by_hash = dict(zip(missing.keys(), fresh))
+        embed_cache.put_many(fresh_by_hash.items(), model_key)
+        cached.update(fresh_by_hash)
+
+    misses = sum(1 for h in hashes if h in missing)
+    return [cached[h] for h in hashes], backend, len(texts) - misses, misses
+
+def _iter_batches(sources: List[Tuple], prev: "IndexSnapshot", size: int,
+                  with_rows: bool = False) -> Iterator[Tuple[List[Dict], object]]:
+    """
+    (records, previous embedding rows or None) in batches of at most `size`,
+    in index order. A source is ("prev", lo, hi) for rows reused from the
+    previous index or ("spill", path) for freshly chunked files; rows are
+    only read with `with_rows`.
+    """
+    for src in sources:
+        if src[0] == "prev":
+            _, lo, hi = src
+            for s in range(lo, hi, size):
+                e = min(hi, s + size)
+                rows = prev.vectors.exact_rows(slice(s, e)) if with_rows else None
+                yield [prev.records[i] for i in range(s, e)], rows
+        else:
+            batch: List[Dict] = []
+            for rec in _read_spill(src[1]):
+                batch.append(rec)
+                if len(batch) == size:
+                    yield batch, None
+                    batch = []
+            if batch:
+                yield batch, None
+
+class _BackendFellBack(Exception):
+    pass
+
+def _write_streamed(meta: Dict, sources: List[Tuple], prev: "IndexSnapshot", backend: str,
+                    force_openai: bool, progress: Callable) -> Dict:
+    """
+    Embed and append `sources` to a new index generation INGEST_BATCH rows
+    at a time, then add the BM25 / ANN arrays and commit. Local embedding
+    takes two passes (IDF is corpus-wide); OpenAI rows unchanged since the
+    previous index are copied, the rest go through the embedding cache.
+    """
+    import numpy as np
+
+    total = meta["count"]
+    writer = index_store.IndexWriter(INDEX_BASE)
+    try:
+        idf = None
+        t0 = time.perf_counter()
+        if backend == "local" and total:
+            df = np.zeros(1 << local_embed.LOCAL_FEATURE_BITS, dtype=np.int64)
+            for records, _ in _iter_batches(sources, prev, INGEST_BATCH):
+                df += local_embed.doc_freqs([r["text"] for r in records])
+            idf = local_embed.idf_from_df(df, total)
+            writer.add_array("local_idf", idf)
+        idf_s = time.perf_counter() - t0
+
+        lexical = bm25.Builder()
+        hits = misses = done = 0
+        embed_s = bm25_s = 0.0
+        progress("embed", 0, total)
+        for records, rows in _iter_batches(sources, prev, INGEST_BATCH, with_rows=backend == "openai"):
+            texts = [r["text"] for r in records]
+            t1 = time.perf_counter()
+            if backend == "local":
+                emb = local_embed.embed(texts, idf=idf)
+            elif rows is not None:
+                emb = rows
+            else:
+                emb, got, h, m = _embed_with_cache(texts, force_openai=force_openai)
+                if got != backend:
+                    raise _BackendFellBack()
+                hits, misses = hits + h, misses + m
+            t2 = time.perf_counter()
+            writer.append(records, emb)
+            t3 = time.perf_counter()
+            lexical.add(texts)
+            embed_s, bm25_s = embed_s + (t2 - t1), bm25_s + (time.perf_counter() - t3)
+            done += len(records)
+            progress("embed", done, total)
+        metrics.INGEST_STAGE.observe(idf_s + embed_s, stage="embed", backend=backend)
+
+        progress("write", 0, total)
+        with metrics.INGEST_STAGE.time(stage="ann", backend=backend):
+            ann_arrays, ann_meta = ann.build_for_ingest(writer.embeddings())
+        if ann_meta:
+            meta["ann"] = ann_meta
+        for name, arr in (ann_arrays or {}).items():
+            writer.add_array(name, arr)
+        if total:
+            with metrics.INGEST_STAGE.time(stage="storage", backend=backend):
+                meta["storage"] = vectors.measure(writer.embeddings(), writer.view(vectors.EMBED_KEEP_FLOAT32))
+            with metrics.INGEST_STAGE.time(stage="pains", backend=backend):
+                pains = _build_pains(writer, backend, idf, force_openai)
+            if pains:
+                meta["pains"] = {"keys": len(pains["pain_vecs"]), "top_n": int(pains["pain_rows"].shape[1])}
+                for name, arr in pains.items():
+                    writer.add_array(name, arr)
+        t1 = time.perf_counter()
+        if total:
+            for name, arr in lexical.arrays().items():
+                writer.add_array(name, arr)
+        metrics.INGEST_STAGE.observe(bm25_s + time.perf_counter() - t1, stage="bm25", backend=backend)
+
+        meta.update({
+            "embed_backend": backend if total else "none",
+            "openai_model": OPENAI_EMBED_MODEL if total and backend == "openai" else None,
+            "local_model": local_embed.MODEL_NAME if total and backend == "local" else None,
+            "cache": {"hits": hits, "misses": misses},
+        })
+        with metrics.INGEST_STAGE.time(stage="write", backend=backend):
+            writer.commit(meta, keep_float32=vectors.EMBED_KEEP_FLOAT32)
+    except BaseException:
+        writer.abort()
+        raise
+    metrics.INGEST_CHUNKS.inc(total, backend=backend)
+    INDEX.reload()
+    progress("write", total, total)
+    return {"meta": meta}
+
+def _build_pains(writer, backend: str, idf, force_openai: bool) -> Optional[Dict]:
+    """
+    Precomputed /analyze retrieval (see pain_index) over the rows written so
+    far, with queries embedded like search-time queries. Skipped, not fatal,
+    if the queries cannot be embedded with the index's backend.
+    """
+    def embed(texts: List[str]):
+        if backend == "local":
+            return _embed_local(texts, idf=idf)
+        emb, got, _, _ = _embed_with_cache(texts, force_openai=force_openai)
+        if got != backend:
+            raise RuntimeError(f"query embedding fell back to {got}")
+        return emb
+
+    try:
+        return pain_index.build(writer.embeddings(), embed)
+    except Exception as e:
+        logger.warning(f"Pain table skipped; /analyze will search live. Error: {e!r}")
+        return None
+
+def ingest_docs_to_json(only_file: str | None = None, force_openai: bool = False,
+                        progress: Optional[Callable[[str, int, int], None]] = None) -> Dict:
     """
     Scans DOCS_DIR for files, chunks them, embeds with OpenAI (or local fallback),
-    and writes a single JSON index to DATA_PATH.
+    and writes the binary index (see index_store) under INDEX_BASE.
+
+    Incremental: files whose content hash matches the current index keep their
+    rows as-is, changed/new files are re-chunked, and chunk embeddings come
+    from the persistent embedding cache where possible. Files no longer in
+    DOCS_DIR are dropped. Files are keyed by their path relative to DOCS_DIR,
+    which is also their chunks' source_path. With `only_file` (such a path),
+    just that file is re-processed and merged into the existing index.
+
+    Streaming: files are extracted page by page into per-file spill files,
+    and rows are then embedded and appended to the new index INGEST_BATCH at
+    a time, so peak memory follows the batch size rather than the corpus.
+
+    `progress(stage, done, total)` is called as the run advances through the
+    extract / embed / write stages (used by background ingest jobs).
 
     Supported: .docx .pdf .txt .md .html .htm
+
+    Returns {"meta": ...}; records are read back through get_index().
+
+    Runs under the index writer lock, so ingests started by different
+    processes (uvicorn workers) run one after the other.
     """
-    import docx
-    from PyPDF2 import PdfReader
+    with index_store.writer_lock(INDEX_BASE):
+        return _ingest(only_file, force_openai, progress or (lambda *a: None))
+
+def _ingest(only_file: Optional[str], force_openai: bool, progress: Callable) -> Dict:
 
     # 1) Gather files
-    supported_ext = {".docx", ".pdf", ".txt", ".md", ".html", ".htm"}
-    files: list[str] = []
-    for root, _, fnames in os.walk(DOCS_DIR):
-        for fn in fnames:
-            if only_file and fn != only_file:
-                continue
-            if os.path.splitext(fn)[1].lower() in supported_ext:
-                files.append(os.path.join(root, fn))
+    files = _gather_files()
+    if only_file and not any(_source_name(p) == only_file for p in files):
+        logger.warning(f"{only_file} not found in {DOCS_DIR}")
 
-    if not files:
-        logger.warning("No supported files found to ingest.")
-        payload = {
-            "meta": {
-                "created_at": int(time.time()),
-                "count": 0,
-                "embed_backend": "none",
-                "openai_model": None,
-                "only_file": only_file,
-            },
-            "records": [],
-        }
-        os.makedirs(os.path.dirname(DATA_PATH), exist_ok=True)
-        with open(DATA_PATH, "w", encoding="utf-8") as f:
-            json.dump(payload, f, ensure_ascii=False, indent=2)
-        return payload
+    prev = INDEX.get()
+    prev_files: Dict = prev.meta.get("files") or {}
+    backend = _target_backend(force_openai)
+    chunking = {"size": CHUNK_SIZE, "overlap": CHUNK_OVERLAP}
+    reusable = (
+        prev.meta.get("embed_backend") == backend
+        and prev.meta.get("openai_model") == (OPENAI_EMBED_MODEL if backend == "openai" else None)
+        and prev.meta.get("chunking") == chunking
+    )
+
+    # A single-file run merges into the previous index only if its rows can
+    # be kept; otherwise the other files would be dropped, so do them all.
+    if only_file and not (reusable and prev_files):
+        logger.info(f"Previous index cannot be merged into; re-processing every file, not just {only_file}")
+        only_file = None
 
-    # 2) Extract + chunk
-    records: list[Dict] = []
+    # 2) Reuse unchanged files, extract + chunk the rest (in parallel)
+    plan: list = []     # (abs_path, sha, previous rows to reuse or None)
     for abs_path in files:
-        fn = os.path.basename(abs_path)
-        ext = os.path.splitext(fn)[1].lower()
-        text = ""
+        fn = _source_name(abs_path)
+        old = prev_files.get(fn)
+        if only_file and fn != only_file:
+            if not old:
+                continue  # not requested and nothing to keep
+            sha = old["sha256"]
+        else:
+            sha = _file_sha256(abs_path)
+        keep = old["rows"] if reusable and old and old.get("sha256") == sha else None
+        plan.append((abs_path, sha, keep))
 
-        try:
-            if ext == ".docx":
-                doc = docx.Document(abs_path)
-                text = "\n".join(p.text for p in doc.paragraphs if p.text.strip())
-            elif ext == ".pdf":
-                reader = PdfReader(abs_path)
-                parts = []
-                for page in reader.pages:
-                    try:
-                        parts.append(page.extract_text() or "")
-                    except Exception:
-                        parts.append("")
-                text = "\n".join(parts)
-            elif ext in {".txt", ".md", ".html", ".htm"}:
-                with open(abs_path, "r", encoding="utf-8", errors="ignore") as f:
-                    text = f.read()
-        except Exception as e:
-            logger.error(f"Failed to read {fn}: {e}")
-            continue
-
-        if not text or not text.strip():
-            logger.warning(f"Empty or unreadable content in {fn}; skipping.")
-            continue
-
-        for i, chunk in enumerate(_split_text(text)):
-            ch = chunk.strip()
-            if not ch:
-                continue
-            records.append({"source_path": fn, "chunk_index": i, "text": ch})
-
-    # 3) Embed
-    texts = [r["text"] for r in records]
-    if not texts:
-        logger.warning("No chunks produced; writing empty index.")
-        payload = {
-            "meta": {
-                "created_at": int(time.time()),
-                "count": 0,
-                "embed_backend": "none",
-                "openai_model": None,
-                "only_file": only_file,
-            },
-            "records": [],
-        }
-        os.makedirs(os.path.dirname(DATA_PATH), exist_ok=True)
-        with open(DATA_PATH, "w", encoding="utf-8") as f:
-            json.dump(payload, f, ensure_ascii=False, indent=2)
-        return payload
-
-    embeddings, backend = _embed_texts(texts, force_openai=force_openai)
-    for r, emb in zip(records, embeddings):
-        r["embedding"] = emb
-
-    # 4) Save index
-    payload = {
-        "meta": {
+    os.makedirs(DATA_DIR, exist_ok=True)
+    spill_dir = tempfile.mkdtemp(prefix=".ingest-", dir=DATA_DIR)
+    try:
+        to_extract = [p for p, _, keep in plan if keep is None]
+        progress("extract", 0, len(to_extract))
+        spilled = dict(zip(to_extract, _chunk_files(to_extract, spill_dir, progress=progress)))
+
+        sources: list = []
+        files_meta: Dict[str, Dict] = {}
+        count = reused = processed = 0
+        for abs_path, sha, keep in plan:
+            fn = _source_name(abs_path)
+            if keep is not None:
+                n = keep[1] - keep[0]
+                src = ("prev", keep[0], keep[1])
+                reused += 1
+            else:
+                spill, n = spilled[abs_path]
+                src = ("spill", spill)
+                processed += 1
+            if n:
+                sources.append(src)
+                files_meta[fn] = {"sha256": sha, "rows": [count, count + n]}
+                count += n
+
+        removed = sorted(set(prev_files) - {_source_name(p) for p in files})
+        if removed:
+            logger.info(f"Dropping chunks from removed files: {removed}")
+
+        meta = {
             "created_at": int(time.time()),
-            "count": len(records),
-            "embed_backend": backend,
-            "openai_model": OPENAI_EMBED_MODEL if backend == "openai" else None,
+            "count": count,
+            "embed_backend": "none",
+            "openai_model": None,
             "only_file": only_file,
-        },
-        "records": records,
-    }
-    os.makedirs(os.path.dirname(DATA_PATH), exist_ok=True)
-    with open(DATA_PATH, "w", encoding="utf-8") as f:
-        json.dump(payload, f, ensure_ascii=False, indent=2)
+            "chunking": chunking,
+            "files": files_meta,
+            "files_reused": reused,
+            "files_processed": processed,
+            "files_removed": removed,
+            "cache": {"hits": 0, "misses": 0},
+        }
+        if not count:
+            logger.warning("No chunks produced; writing empty index.")
 
-    logger.info(f"Ingested {len(records)} chunks, backend={backend}")
+        # 3) Embed + append in batches, then save. If OpenAI falls back
+        #    mid-run, reused rows live in the other space: redo it locally.
+        try:
+            payload = _write_streamed(meta, sources, prev, backend, force_openai, progress)
+        except _BackendFellBack:
+            logger.warning("Embedding backend fell back to local mid-run; re-embedding the corpus locally.")
+            backend = "local"
+            payload = _write_streamed(meta, sources, prev, backend, force_openai, progress)
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+    logger.info(
+        f"Ingested {count} chunks, backend={backend}, files reused={reused} "
+        f"processed={processed} removed={len(removed)}, cache hits={meta['cache']['hits']} "
+        f"misses={meta['cache']['misses']}"
+    )
     return payload
 
+# -------------------------
+# Resident index
+# -------------------------
+_EMPTY_META = {"created_at": 0, "count": 0, "embed_backend": "none"}
+
+class IndexSnapshot:
+    """
+    One immutable version of the on-disk index. Queries hold a reference to
+    the snapshot they started with, so a reload never changes the data
+    underneath them.
+
+    `matrix` is the memory-mapped [count, dim] float32 embedding file with
+    unit-normalised rows (normalisation and masking of malformed rows happen
+    once, at write time); `vectors` is what dense search scans: the same
+    matrix, or its float16 / int8 copy (see vectors.py). `records` parses a
+    record only when it is read.
+    """
+    def __init__(self, header: Optional[Dict], fingerprint: Optional[Tuple] = None):
+        import numpy as np
+
+        header = header or {}
+        self.meta: Dict = header.get("meta") or dict(_EMPTY_META)
+        self.generation = str(header.get("generation") or "")
+        self.data = {"meta": self.meta, "version": self.version}
+        self.fingerprint = fingerprint
+        self.loaded_at = time.time()
+
+        arrays = header.get("arrays") or {}
+        emb = arrays.get("embeddings")
+        self.matrix = index_store.map_array(INDEX_BASE, emb) if emb else np.zeros((0, 0), dtype=np.float32)
+        exact = self.matrix if emb else None
+        if "emb_q8" in arrays:
+            self.vectors = vectors.Vectors("int8", index_store.map_array(INDEX_BASE, arrays["emb_q8"]),
+                                           index_store.map_array(INDEX_BASE, arrays["emb_scale"]), exact=exact)
+        elif "emb_f16" in arrays:
+            self.vectors = vectors.Vectors("float16", index_store.map_array(INDEX_BASE, arrays["emb_f16"]), exact=exact)
+        else:
+            self.vectors = vectors.Vectors("float32", self.matrix)
+        self.dim = self.vectors.dim
+        self.records = index_store.RecordStore(INDEX_BASE, header.get("records"))
+
+        self.local_idf = index_store.map_array(INDEX_BASE, arrays["local_idf"]) if "local_idf" in arrays else None
+
+        self.bm25: Optional[bm25.BM25Index] = None
+        if all(name in arrays for name in bm25.ARRAYS):
+            self.bm25 = bm25.BM25Index({name: index_store.map_array(INDEX_BASE, arrays[name])
+                                        for name in bm25.ARRAYS + bm25.OPTIONAL_ARRAYS if name in arrays})
+
+        self.ivf: Optional[Dict] = None
+        if all(f"ivf_{k}" in arrays for k in ("centroids", "order", "offsets")):
+            self.ivf = {k: index_store.map_array(INDEX_BASE, arrays[f"ivf_{k}"])
+                        for k in ("centroids", "order", "offsets")}
+
+        self.pains: Optional[pain_index.PainTable] = None
+        if all(name in arrays for name in pain_index.ARRAYS):
+            self.pains = pain_index.PainTable({name: index_store.map_array(INDEX_BASE, arrays[name])
+                                               for name in pain_index.ARRAYS})
+
+        self._sources: Optional[Dict[str, List[Tuple[int, int]]]] = None
+        self._filters = TTLCache(256, 0, name="source_filters")
+
+    @property
+    def version(self) -> str:
+        """Unique per committed generation (created_at has whole-second resolution)."""
+        return self.generation
+
+    # -------------------------
+    # Source filters
+    # -------------------------
+    @property
+    def sources(self) -> Dict[str, List[Tuple[int, int]]]:
+        """source_path -> row ranges. From meta.files; legacy indexes are scanned once."""
+        if self._sources is None:
+            files = self.meta.get("files")
+            if files:
+                out = {fn: [tuple(v["rows"])] for fn, v in files.items() if v["rows"][1] > v["rows"][0]}
+            else:
+                out: Dict[str, List[Tuple[int, int]]] = {}
+                for i, r in enumerate(self.records):
+                    runs = out.setdefault(r.get("source_path", ""), [])
+                    if runs and runs[-1][1] == i:
+                        runs[-1] = (runs[-1][0], i + 1)
+                    else:
+                        runs.append((i, i + 1))
+            self._sources = out
+        return self._sources
+
+    def source_ranges(self, include: Optional[List[str]] = None,
+                      exclude: Optional[List[str]] = None) -> Optional[List[Tuple[int, int]]]:
+        """
+        Sorted, merged row ranges of the sources matching `include` (all if
+        empty) and not `exclude`. Entries are source names or glob patterns.
+        None means no filter at all.
+        """
+        if not include and not exclude:
+            return None
+        key = (tuple(include or ()), tuple(exclude or ()))
+        hit = self._filters.get(key)
+        if hit is not None:
+            return hit
+
+        def matches(name: str, patterns) -> bool:
+            return any(name == p or fnmatch.fnmatchcase(name, p) for p in patterns)
+
+        picked = sorted(r for name, runs in self.sources.items()
+                        if (not include or matches(name, include)) and not (exclude and matches(name, exclude))
+                        for r in runs)
+        merged: List[Tuple[int, int]] = []
+        for lo, hi in picked:
+            if merged and merged[-1][1] == lo:
+                merged[-1] = (merged[-1][0], hi)
+            else:
+                merged.append((lo, hi))
+        self._filters.set(key, merged)
+        return merged
+
+    def _rescoring(self) -> bool:
+        return vectors.EMBED_RESCORE and self.vectors.can_rescore()
+
+    def _rescore(self, rows, q, top_k: int) -> Tuple:
+        with metrics.SEARCH_SCORE.time(backend=self.meta.get("embed_backend", "local"), method="rescore"):
+            rows, scores = self.vectors.rescore(rows, q)
+        return rows[:top_k], scores[:top_k]
+
+    def dense(self, q_emb: List[float], top_k: int, nprobe: Optional[int] = None,
+              ranges: Optional[List[Tuple[int, int]]] = None) -> Tuple:
+        """
+        Cosine top-k as (row ids, scores), best first. Uses the IVF index when
+        one was built and ANN_INDEX=ivf (nprobe trades recall for speed);
+        otherwise, or when the probed lists hold fewer than top_k rows, one
+        mat-vec product over the scanned vectors plus argpartition. Over
+        compressed vectors, EMBED_RESCORE_FACTOR * top_k candidates are
+        rescored against the float32 rows when those were kept.
+
+        With `ranges` (see source_ranges) only those rows are scored, by
+        exact scan over their slices; IVF is not used.
+        """
+        import numpy as np
+
+        n = len(self.vectors)
+        if not n or top_k <= 0 or len(q_emb) != self.dim or ranges == []:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        q = np.array(q_emb, dtype=np.float32)
+        q /= max(float(np.linalg.norm(q)), 1e-8)
+        rescore = self._rescoring()
+        k = top_k * vectors.EMBED_RESCORE_FACTOR if rescore else top_k
+
+        backend = self.meta.get("embed_backend", "local")
+        if ranges is not None:
+            with metrics.SEARCH_SCORE.time(backend=backend, method="filtered"):
+                pos, scores = vectors.top_k(self.vectors.scores(q, ranges), k)
+                idx = _range_rows(ranges)[pos]
+            return self._rescore(idx, q, top_k) if rescore else (idx, scores)
+
+        if self.ivf is not None and ann.enabled():
+            t0 = time.perf_counter()
+            rows, scores = ann.search(self.vectors, self.ivf, q, k, nprobe or ann.ANN_NPROBE)
+            if rows is not None:
+                metrics.SEARCH_SCORE.observe(time.perf_counter() - t0, backend=backend, method="ivf")
+                return self._rescore(rows, q, top_k) if rescore else (rows, scores)
+
+        method = "exact" if self.vectors.kind == "float32" else self.vectors.kind
+        with metrics.SEARCH_SCORE.time(backend=backend, method=method):
+            idx, scores = vectors.top_k(self.vectors.scores(q), k)
+        return self._rescore(idx, q, top_k) if rescore else (idx, scores)
+
+    def lexical(self, query: str, top_k: int, ranges: Optional[List[Tuple[int, int]]] = None) -> Tuple:
+        """
+        BM25 top-k as (row ids, scores); empty if the index has no postings.
+        With `ranges`, postings outside them are dropped before ranking.
+        """
+        import numpy as np
+
+        if self.bm25 is None or top_k <= 0 or ranges == []:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        with metrics.SEARCH_SCORE.time(backend="bm25", method="bm25"):
+            if ranges is None:
+                return self.bm25.top_k(query, top_k)
+            rows, scores = self.bm25.scores(query)
+            keep = _in_ranges(rows, ranges)
+            rows, scores = rows[keep], scores[keep]
+            if not len(rows):
+                return rows, scores
+            idx, scores = vectors.top_k(scores, top_k)
+            return rows[idx], scores
+
+    def top_k(self, q_emb: List[float], top_k: int, nprobe: Optional[int] = None,
+              ranges: Optional[List[Tuple[int, int]]] = None) -> List[Tuple[float, Dict]]:
+        rows, scores = self.dense(q_emb, top_k, nprobe, ranges)
+        return [(float(sc), self.records[i]) for i, sc in zip(rows, scores)]
+
+def _range_rows(ranges: List[Tuple[int, int]]):
+    """Row ids covered by `ranges`, in order."""
+    import numpy as np
+
+    if not ranges:
+        return np.zeros(0, dtype=np.int64)
+    return np.concatenate([np.arange(lo, hi, dtype=np.int64) for lo, hi in ranges])
+
+def _in_ranges(rows, ranges: List[Tuple[int, int]]):
+    """Boolean mask: which of `rows` fall inside the sorted, disjoint `ranges`."""
+    import numpy as np
+
+    starts = np.array([lo for lo, _ in ranges], dtype=np.int64)
+    ends = np.array([hi for _, hi in ranges], dtype=np.int64)
+    pos = np.searchsorted(starts, rows, side="right") - 1
+    return (pos >= 0) & (rows < ends[np.maximum(pos, 0)])
+
+class ChunkIndex:
+    """
+    Process-wide holder for the chunk index. Maps the index under `base` once
+    and serves queries from it; reloads when the header's mtime/size changes
+    (e.g. after /admin/reingest or /admin/upload). While a reload is running,
+    other callers keep getting the previous snapshot instead of blocking.
+
+    With several worker processes, whichever one commits a new index bumps
+    the shared generation counter; every other worker sees the new value on
+    its next query (one read of a mapped page) and switches over. The header
+    is also stat()ed every INDEX_STAT_INTERVAL seconds to catch files
+    replaced by hand.
+
+    A legacy pretty-printed JSON index at `legacy_json` is converted to the
+    binary format the first time it is read (or when it is newer than the
+    binary header).
+    """
+    def __init__(self, base: str, legacy_json: Optional[str] = None):
+        self.base = base
+        self.path = index_store.header_path(base)
+        self.legacy_json = legacy_json
+        self._snap: Optional[IndexSnapshot] = None
+        self._lock = threading.Lock()
+        self._counter = index_store.GenerationCounter(base)
+        self._seen = (-1, 0.0)     # (generation counter, monotonic time) at the last header check
+
+    def _fingerprint(self) -> Optional[Tuple]:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _legacy_pending(self, fingerprint: Optional[Tuple]) -> bool:
+        if not self.legacy_json:
+            return False
+        try:
+            legacy_mtime = os.stat(self.legacy_json).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        return fingerprint is None or legacy_mtime > fingerprint[0]
+
+    def _convert_legacy(self, fingerprint: Optional[Tuple]) -> Optional[Tuple]:
+        """
+        Convert a pending legacy JSON index; returns the header fingerprint
+        afterwards. Takes the writer lock, so it must run before self._lock is
+        acquired: ingest holds the writer lock while it reads the index.
+        """
+        if not self._legacy_pending(fingerprint):
+            return fingerprint
+        with index_store.writer_lock(self.base):
+            if self._legacy_pending(self._fingerprint()):     # another worker may have converted it
+                with metrics.INDEX_LOAD.time(source="legacy_json"):
+                    index_store.convert_legacy_json(self.legacy_json, self.base)
+        return self._fingerprint()
+
+    def _load(self, fingerprint: Optional[Tuple]) -> IndexSnapshot:
+        if fingerprint is None:
+            return IndexSnapshot(None, None)
+        t0 = time.perf_counter()
+        snap = IndexSnapshot(index_store.read_header(self.base), fingerprint)
+        elapsed = time.perf_counter() - t0
+        metrics.INDEX_LOAD.observe(elapsed, source="header")
+        metrics.INDEX_ROWS.set(len(snap.records))
+        logger.info(f"Loaded index version={snap.version} count={len(snap.records)} in {elapsed:.3f}s")
+        return snap
+
+    def get(self) -> IndexSnapshot:
+        snap = self._snap
+        gen, now = self._counter.value(), time.monotonic()
+        if snap is not None and gen == self._seen[0] and now - self._seen[1] < INDEX_STAT_INTERVAL:
+            return snap
+        fp = self._fingerprint()
+        self._seen = (gen, now)
+        if snap is not None and snap.fingerprint == fp:
+            return snap
+        fp = self._convert_legacy(fp)
+
+        # Someone else is already reloading: serve the old snapshot meanwhile.
+        if snap is not None and not self._lock.acquire(blocking=False):
+            return snap
+        if snap is None:
+            self._lock.acquire()
+        try:
+            snap = self._snap
+            if snap is not None and snap.fingerprint == fp:
+                return snap
+            try:
+                self._snap = self._load(fp)
+            except Exception as e:
+                # Half-written or corrupt index: keep serving what we had.
+                logger.error(f"Index reload failed, keeping previous snapshot. Error: {e}")
+                if snap is None:
+                    raise
+            return self._snap
+        finally:
+            self._lock.release()
+
+    def reload(self) -> IndexSnapshot:
+        """Force a reload now (used right after ingest writes a new index)."""
+        self._convert_legacy(self._fingerprint())
+        with self._lock:
+            self._snap = self._load(self._fingerprint())
+            return self._snap
+
+INDEX = ChunkIndex(INDEX_BASE, legacy_json=DATA_PATH)
+
+def get_index() -> IndexSnapshot:
+    return INDEX.get()
+
+def warm_up() -> Dict:
+    """
+    Load and sanity-check the current index and pay the first-query costs up
+    front: NumPy and BLAS initialisation, paging in the scanned vectors, the
+    BM25 vocabulary, and the query-embedding client or local embedder.
+    Returns a summary; "problems" lists inconsistencies found.
+    """
+    import numpy as np
+
+    t0 = time.perf_counter()
+    snap = INDEX.get()
+    rows = len(snap.records)
+    problems = []
+    if len(snap.vectors) != rows:
+        problems.append(f"{len(snap.vectors)} embedding rows for {rows} records")
+    if int(snap.meta.get("count", rows)) != rows:
+        problems.append(f"meta.count={snap.meta.get('count')} but {rows} records")
+    if snap.bm25 is not None and snap.bm25.n_docs != rows:
+        problems.append(f"BM25 covers {snap.bm25.n_docs} rows of {rows}")
+    if snap.ivf is not None and len(snap.ivf["order"]) != rows:
+        problems.append(f"IVF covers {len(snap.ivf['order'])} rows of {rows}")
+    if snap.pains is not None and snap.pains.top_n and int(snap.pains.rows.max()) >= rows:
+        problems.append(f"pain table points past row {rows}")
+    backend = snap.meta.get("embed_backend", "none")
+    if rows and backend == "local" and snap.local_idf is None:
+        problems.append("local index without IDF weights")
+
+    if rows and snap.dim:
+        q = np.zeros(snap.dim, dtype=np.float32)
+        q[0] = 1.0
+        snap.vectors.scores(q)               # pages the scanned rows in
+    if snap.bm25 is not None:
+        snap.bm25.top_k("warm up", 1)        # decodes the vocabulary
+    if backend == "openai":
+        _openai_client()
+    elif rows:
+        _embed_local(["warm up"], idf=snap.local_idf, dim=snap.dim or local_embed.LOCAL_EMBED_DIM)
+
+    for p in problems:
+        logger.warning(f"Index check: {p}")
+    return {
+        "version": snap.version,
+        "rows": rows,
+        "dim": snap.dim,
+        "storage": snap.vectors.kind,
+        "embed_backend": backend,
+        "problems": problems,
+        "seconds": round(time.perf_counter() - t0, 3),
+    }
+
 # -------------------------
 # Search
 # -------------------------
-def search_chunks(query: str, top_k: int = 5) -> Tuple[List[Dict], Dict]:
+QUERY_EMBEDDINGS = TTLCache(QUERY_EMBED_CACHE_SIZE, QUERY_EMBED_CACHE_TTL, name="query_embeddings")
+
+def _normalize_query(query: str) -> str:
+    return " ".join(query.split())
+
+def _query_model(snap: IndexSnapshot) -> str:
+    if snap.meta.get("embed_backend", "local") == "openai":
+        return snap.meta.get("openai_model") or OPENAI_EMBED_MODEL
+    return "local"
+
+def _embed_queries(queries: List[str], snap: IndexSnapshot) -> List:
+    """
+    Embed queries with the index's backend, through an LRU+TTL cache keyed
+    by (normalised query, embed model, index version). All misses go out in
+    one batched embedding call, tried QUERY_EMBED_RETRIES + 1 times with a
+    QUERY_EMBED_TIMEOUT timeout and at most QUERY_EMBED_BACKOFF_MAX between
+    tries, so callers can fall back to lexical quickly.
+    """
+    model = _query_model(snap)
+    backend = "local" if model == "local" else "openai"
+    keys = [(_normalize_query(q), model, snap.version) for q in queries]
+    out = [QUERY_EMBEDDINGS.get(k) for k in keys]
+
+    missing = list(dict.fromkeys(k[0] for k, e in zip(keys, out) if e is None))
+    metrics.QUERY_EMBED_CACHE.inc(len(keys) - len(missing), backend=backend, result="hit")
+    if missing:
+        metrics.QUERY_EMBED_CACHE.inc(len(missing), backend=backend, result="miss")
+        with metrics.QUERY_EMBED.time(backend=backend):
+            if model == "local":
+                fresh = _embed_local(missing, idf=snap.local_idf, dim=snap.dim or local_embed.LOCAL_EMBED_DIM)
+            else:
+                fresh = _embed_openai(missing, model=model, retries=QUERY_EMBED_RETRIES,
+                                      timeout=QUERY_EMBED_TIMEOUT, max_delay=QUERY_EMBED_BACKOFF_MAX)
+        by_text = dict(zip(missing, fresh))
+        for text, emb in by_text.items():
+            QUERY_EMBEDDINGS.set((text, model, snap.version), emb)
+        out = [e if e is not None else by_text[k[0]] for k, e in zip(keys, out)]
+    return out
+
+def _embed_query(query: str, snap: IndexSnapshot) -> List[float]:
+    return _embed_queries([query], snap)[0]
+
+def embed_query(query: str) -> Tuple[List[float], str]:
+    """(embedding, index version) of a query against the current index."""
+    snap = get_index()
+    return _embed_query(query, snap), snap.version
+
+def cached_query_embedding(query: str) -> Tuple[Optional[List[float]], str]:
+    """
+    (embedding or None, index version) of a query from the query cache only,
+    e.g. the one search_chunks just computed; never calls the backend.
+    """
+    snap = get_index()
+    return QUERY_EMBEDDINGS.get((_normalize_query(query), _query_model(snap), snap.version)), snap.version
+
+def search_chunks(query: str, top_k: int = 5, nprobe: Optional[int] = None,
+                  mode: Optional[str] = None, include: Optional[List[str]] = None,
+                  exclude: Optional[List[str]] = None) -> Tuple[List[Dict], Dict]:
     """
     Return top_k most similar chunks to query, embedding the query with
-    the SAME backend as the stored index (OpenAI vs local).
+    the SAME backend as the stored index (OpenAI vs local). `nprobe`
+    overrides ANN_NPROBE when an IVF index is in use.
+
+    `mode` (default SEARCH_MODE): "dense" cosine only, "lexical" BM25 only
+    (no embedding call), or "hybrid" reciprocal-rank fusion of both. If the
+    query cannot be embedded (e.g. OpenAI unreachable), dense and hybrid
+    degrade to lexical; data["mode"] is the mode actually used.
+
+    `include` / `exclude` restrict the search to matching sources (names or
+    glob patterns on source_path); only their rows are scored.
     """
-    if not os.path.exists(DATA_PATH):
-        return [], {"meta": {"created_at": 0, "count": 0, "embed_backend": "none"}}
+    mode = (mode or SEARCH_MODE).lower()
+    snap = get_index()
+    records = snap.records
+    ranges = snap.source_ranges(include, exclude)
+    if not records or ranges == []:
+        return [], {**snap.data, "mode": mode}
+
+    if mode == "lexical" and snap.bm25 is not None:
+        rows, _ = snap.lexical(query, top_k, ranges)
+        return [records[i] for i in rows], {**snap.data, "mode": "lexical"}
 
-    with open(DATA_PATH, "r", encoding="utf-8") as f:
-        data = json.load(f)
+    try:
+        q_emb = _embed_query(query, snap)
+    except Exception as e:
+        if snap.bm25 is None:
+            raise
+        logger.warning(f"Query embedding failed, answering {mode} query lexically. Error: {e}")
+        metrics.SEARCH_FALLBACK.inc(requested=mode)
+        rows, _ = snap.lexical(query, top_k, ranges)
+        return [records[i] for i in rows], {**snap.data, "mode": "lexical"}
 
-    records = data.get("records", [])
-    meta = data.get("meta", {})
-    if not records:
+    if mode == "hybrid" and snap.bm25 is not None:
+        n = max(top_k, HYBRID_CANDIDATES)
+        dense_rows, _ = snap.dense(q_emb, n, nprobe=nprobe, ranges=ranges)
+        lex_rows, _ = snap.lexical(query, n, ranges)
+        return [records[i] for i, _ in bm25.rrf([dense_rows, lex_rows], top_k)], {**snap.data, "mode": "hybrid"}
+
+    return [r for _, r in snap.top_k(q_emb, top_k, nprobe=nprobe, ranges=ranges)], {**snap.data, "mode": "dense"}
+
+def search_pains(role: str, options: List[str], top_k: int = 6) -> Tuple[List[Dict], Dict, str]:
+    """
+    search_chunks for the /analyze pain query (pain_index.pain_query),
+    answered from the precomputed table when the role and every option are
+    in it. Returns (results, data, "precomputed" | "live"). Several options
+    are re-ranked against the query itself on local indexes (embedding it
+    is in-process); OpenAI indexes use the stored option vectors instead of
+    an embedding request. Hybrid mode fuses the stored dense list with BM25
+    on the same query; lexical mode always searches live.
+    """
+    mode = SEARCH_MODE
+    snap = get_index()
+    query = pain_index.pain_query(role, options)
+    if snap.pains is not None and snap.records and mode != "lexical":
+        hybrid = mode == "hybrid" and snap.bm25 is not None
+        n = max(top_k, HYBRID_CANDIDATES) if hybrid else top_k
+        q = None
+        if len(set(options)) > 1 and snap.meta.get("embed_backend") == "local":
+            q = _embed_query(query, snap)
+        hit = snap.pains.lookup(role, options, n, snap.vectors.exact_rows, q)
+        if hit is not None:
+            rows = hit[0]
+            if hybrid:
+                lex_rows, _ = snap.lexical(query, n)
+                rows = [i for i, _ in bm25.rrf([rows, lex_rows], top_k)]
+            return [snap.records[i] for i in rows[:top_k]], {**snap.data, "mode": "hybrid" if hybrid else "dense"}, "precomputed"
+    results, data = search_chunks(query, top_k)
+    return results, data, "live"
+
+def search_chunks_many(queries: List[str], top_k: int = 5, mode: Optional[str] = None,
+                       include: Optional[List[str]] = None,
+                       exclude: Optional[List[str]] = None) -> Tuple[List[List[Dict]], Dict]:
+    """
+    Batch form of search_chunks: results per query, in input order.
+
+    All queries are embedded in one batched call (cache misses only) and
+    scored with one [queries x dim] x [dim x rows] product per block of
+    queries, blocks sized so the score matrix stays under BATCH_SCORE_BUDGET
+    cells. Dense scoring here never uses IVF (compressed vectors are still
+    rescored as in IndexSnapshot.dense); lexical / hybrid modes add
+    per-query BM25 as in search_chunks. `include` / `exclude` apply to every
+    query. data["mode"] is the mode actually used, as in search_chunks.
+    """
+    import numpy as np
+
+    mode = (mode or SEARCH_MODE).lower()
+    snap = get_index()
+    data = {**snap.data, "mode": mode}
+    records = snap.records
+    if not queries:
         return [], data
+    ranges = snap.source_ranges(include, exclude)
+    if not records or top_k <= 0 or ranges == []:
+        return [[] for _ in queries], data
 
-    # Choose query embedding backend to match the index
-    idx_backend = meta.get("embed_backend", "local")
-    if idx_backend == "openai":
-        q_emb = _embed_openai([query], model=meta.get("openai_model", OPENAI_EMBED_MODEL))[0]
-    else:
-        q_emb = _embed_local([query])[0]
-
-    # Cosine similarity (using numpy)
-    from numpy import dot
-    from numpy.linalg import norm
-
-    def cos(a, b):
-        return float(dot(a, b) / (norm(a) * norm(b) + 1e-8))
-
-    scored = []
-    for r in records:
-        emb = r.get("embedding")
-        # Skip any malformed rows
-        if not isinstance(emb, list):
-            continue
-        if len(emb) != len(q_emb):
-            # If you ever had a mixed index (old + new), skip mismatched dims
-            continue
-        scored.append((cos(q_emb, emb), r))
-
-    scored.sort(key=lambda x: x[0], reverse=True)
-    return [r for _, r in scored[:top_k]], data
+    def lexical_all():
+        return [[records[i] for i in snap.lexical(q, top_k, ranges)[0]] for q in queries]
+
+    if mode == "lexical" and snap.bm25 is not None:
+        return lexical_all(), data
+
+    try:
+        q_embs = _embed_queries(queries, snap)
+    except Exception as e:
+        if snap.bm25 is None:
+            raise
+        logger.warning(f"Batch query embedding failed, answering {mode} queries lexically. Error: {e}")
+        metrics.SEARCH_FALLBACK.inc(requested=mode)
+        return lexical_all(), {**data, "mode": "lexical"}
+    data["mode"] = "hybrid" if mode == "hybrid" and snap.bm25 is not None else "dense"
+
+    n = len(snap.vectors) if ranges is None else sum(hi - lo for lo, hi in ranges)
+    row_ids = None if ranges is None else _range_rows(ranges)
+    k = min(max(top_k, HYBRID_CANDIDATES) if mode == "hybrid" else top_k, n)
+    rescore = snap._rescoring()
+    kc = min(k * vectors.EMBED_RESCORE_FACTOR, n) if rescore else k
+    dense_rows: List = [np.zeros(0, dtype=np.int64)] * len(queries)
+    valid = [i for i, e in enumerate(q_embs) if len(e) == snap.dim]
+    if n and valid and snap.dim:
+        Q = np.array([q_embs[i] for i in valid], dtype=np.float32)
+        Q /= np.maximum(np.linalg.norm(Q, axis=1, keepdims=True), 1e-8)
+        block = max(1, BATCH_SCORE_BUDGET // n)
+        with metrics.SEARCH_SCORE.time(backend=snap.meta.get("embed_backend", "local"), method="batch"):
+            for s in range(0, len(valid), block):
+                scores = snap.vectors.matmul(Q[s:s + block], ranges)  # [block, rows]
+                idx = np.argpartition(-scores, kc - 1, axis=1)[:, :kc]
+                part = np.take_along_axis(scores, idx, axis=1)
+                order = np.argsort(-part, axis=1, kind="stable")
+                idx = np.take_along_axis(idx, order, axis=1)
+                if row_ids is not None:
+                    idx = row_ids[idx]
+                for j, row in enumerate(idx):
+                    dense_rows[valid[s + j]] = snap.vectors.rescore(row, Q[s + j])[0][:k] if rescore else row
+
+    out: List[List[Dict]] = []
+    for q, rows in zip(queries, dense_rows):
+        if mode == "hybrid" and snap.bm25 is not None:
+            lex_rows, _ = snap.lexical(q, k, ranges)
+            rows = [i for i, _ in bm25.rrf([rows, lex_rows], top_k)]
+        out.append([records[i] for i in rows[:top_k]])
+    return out, data
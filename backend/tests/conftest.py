@@ -0,0 +1,38 @@
+import os, sys, tempfile
+
+# search.py reads its paths from the environment at import time, so point
+# them at a scratch directory before any test module imports it.
+_ROOT = tempfile.mkdtemp(prefix="gsos-tests-")
+os.environ["DATA_DIR"] = os.path.join(_ROOT, "data")
+os.environ["DOCS_DIR"] = os.path.join(_ROOT, "docs")
+os.environ.pop("OPENAI_API_KEY", None)
+os.environ.pop("FORCE_OPENAI", None)
+os.makedirs(os.environ["DOCS_DIR"], exist_ok=True)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import shutil
+
+import pytest
+
+CORPUS = {
+    "a.txt": " ".join(f"alpha{i}" for i in range(600)),
+    "b.txt": " ".join(f"bravo{i}" for i in range(600)),
+    "c.txt": " ".join(f"charlie{i}" for i in range(600)),
+}
+
+@pytest.fixture
+def corpus():
+    """A fresh DOCS_DIR holding CORPUS and an empty DATA_DIR; yields the file texts."""
+    import search
+
+    shutil.rmtree(search.DATA_DIR, ignore_errors=True)
+    shutil.rmtree(search.DOCS_DIR, ignore_errors=True)
+    os.makedirs(search.DOCS_DIR)
+    for fn, text in CORPUS.items():
+        with open(os.path.join(search.DOCS_DIR, fn), "w") as f:
+            f.write(text)
+    search.INDEX.reload()
+    yield dict(CORPUS)
+    shutil.rmtree(search.DATA_DIR, ignore_errors=True)
+    search.INDEX.reload()
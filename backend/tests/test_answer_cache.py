@@ -0,0 +1,49 @@
+import numpy as np
+
+import search
+from caching import SemanticCache
+
+def test_semantic_cache_threshold_and_scope():
+    cache = SemanticCache(maxsize=8, threshold=0.95)
+    base = np.array([1.0, 0.0, 0.0], dtype=np.float32)
+    close = np.array([1.0, 0.1, 0.0], dtype=np.float32)   # cosine ~0.995
+    far = np.array([1.0, 1.0, 0.0], dtype=np.float32)     # cosine ~0.707
+    scope = ("gen-1", frozenset({("a.txt", 0)}))
+    cache.store(base, scope, "what is alpha", "answer")
+
+    value, similarity, matched = cache.lookup(close, scope)
+    assert value == "answer" and matched == "what is alpha" and similarity >= 0.95
+    assert cache.lookup(far, scope) is None
+    assert cache.lookup(base, ("gen-2", scope[1])) is None
+    assert cache.lookup(base, ("gen-1", frozenset({("b.txt", 0)}))) is None
+
+def test_semantic_lookup_hits_then_misses_after_reingest(corpus):
+    import main
+
+    main.ANSWERS.clear()
+    search.ingest_docs_to_json()
+    query = "alpha1 alpha2"
+    results, data = search.search_chunks(query, 3, mode="dense")
+    answer, info, remember = main._semantic_lookup(query, data, results)
+    assert answer is None and not info["hit"]
+    remember("stored answer")
+
+    results, data = search.search_chunks(query, 3, mode="dense")
+    answer, info, _ = main._semantic_lookup(query, data, results)
+    assert answer == "stored answer" and info["hit"]
+
+    search.ingest_docs_to_json()   # same files, new generation
+    results, data = search.search_chunks(query, 3, mode="dense")
+    answer, info, _ = main._semantic_lookup(query, data, results)
+    assert answer is None and not info["hit"]
+
+def test_semantic_lookup_skipped_for_lexical_search(corpus):
+    import main
+
+    main.ANSWERS.clear()
+    search.ingest_docs_to_json()
+    search.QUERY_EMBEDDINGS.clear()
+    results, data = search.search_chunks("bravo3", 3, mode="lexical")
+    answer, info, remember = main._semantic_lookup("bravo3", data, results)
+    remember("never stored")
+    assert answer is None and len(main.ANSWERS) == 0
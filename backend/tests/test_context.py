@@ -0,0 +1,45 @@
+import context
+
+A0 = "The quick brown fox jumps over the lazy dog near the river bank today"
+A1 = "the lazy dog near the river bank today and then it sleeps soundly"
+A2 = "it sleeps soundly until the morning bell rings across the whole valley"
+
+def _hit(src, idx, text):
+    return {"source_path": src, "chunk_index": idx, "text": text}
+
+def test_adjacent_chunks_merge_without_repeating_overlap():
+    spans = context.merge_spans([_hit("a.txt", 1, A1), _hit("a.txt", 0, A0)])
+    assert len(spans) == 1
+    span = spans[0]
+    assert span.chunks == [0, 1] and span.rank == 0
+    assert span.text == A0 + " and then it sleeps soundly"
+    assert span.text.count("the river bank today") == 1
+
+def test_non_adjacent_chunks_and_other_sources_stay_separate():
+    spans = context.merge_spans([_hit("a.txt", 0, A0), _hit("a.txt", 2, A2), _hit("b.txt", 1, A1)])
+    assert [(s.source_path, s.chunks) for s in spans] == [("a.txt", [0]), ("a.txt", [2]), ("b.txt", [1])]
+    assert spans[1].text == A2
+
+def test_citation_labels_name_the_merged_chunks():
+    packed = context.pack([_hit("a.txt", 0, A0), _hit("a.txt", 1, A1), _hit("a.txt", 2, A2), _hit("b.txt", 4, A0)])
+    assert [s.ref for s in packed.spans] == ["a.txt#0-2", "b.txt#4"]
+    assert packed.text.startswith("[a.txt#0-2] ") and "\n\n[b.txt#4] " in packed.text
+    assert [c["ref"] for c in packed.citations()] == ["a.txt#0", "a.txt#1", "a.txt#2", "b.txt#4"]
+    assert packed.info()["dropped"] == []
+
+def test_span_over_budget_falls_back_to_its_best_chunk():
+    hits = [_hit("a.txt", 1, A1), _hit("a.txt", 0, A0), _hit("a.txt", 2, A2)]
+    merged = context.merge_spans(hits)[0]
+    budget = len(merged.block) // 4 - 5                 # the whole span no longer fits
+    assert len(f"[a.txt#1] {A1}") / 4 <= budget         # its best chunk alone does
+
+    packed = context.pack(hits, budget=budget)
+    assert [s.ref for s in packed.spans] == ["a.txt#1"]
+    assert packed.spans[0].text == A1
+    assert sorted(packed.dropped) == ["a.txt#0", "a.txt#2"]
+    assert packed.tokens <= budget
+
+def test_top_hit_is_truncated_when_nothing_fits():
+    packed = context.pack([_hit("a.txt", 0, A0 * 10)], budget=10)
+    assert [s.ref for s in packed.spans] == ["a.txt#0"]
+    assert len(packed.spans[0].block) <= 40
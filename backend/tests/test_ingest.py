@@ -0,0 +1,129 @@
+import os
+
+import pytest
+
+import search
+
+pytestmark = pytest.mark.usefixtures("corpus")
+
+def _texts(fn):
+    snap = search.get_index()
+    lo, hi = snap.meta["files"][fn]["rows"]
+    return [snap.records[i]["text"] for i in range(lo, hi)]
+
+def test_only_file_merges_into_reusable_index(corpus):
+    search.ingest_docs_to_json()
+    before = {fn: _texts(fn) for fn in corpus}
+    with open(os.path.join(search.DOCS_DIR, "b.txt"), "w") as f:
+        f.write("changed " * 400)
+
+    meta = search.ingest_docs_to_json(only_file="b.txt")["meta"]
+    assert sorted(meta["files"]) == sorted(corpus)
+    assert meta["files_reused"] == 2 and meta["files_processed"] == 1
+    assert _texts("a.txt") == before["a.txt"] and _texts("c.txt") == before["c.txt"]
+    assert _texts("b.txt") != before["b.txt"]
+    assert meta["count"] == len(search.get_index().records)
+
+def test_only_file_reprocesses_everything_when_index_not_reusable(monkeypatch, corpus):
+    search.ingest_docs_to_json()
+    monkeypatch.setattr(search, "CHUNK_SIZE", search.CHUNK_SIZE // 2)
+
+    meta = search.ingest_docs_to_json(only_file="a.txt")["meta"]
+    assert sorted(meta["files"]) == sorted(corpus)
+    assert meta["files_reused"] == 0 and meta["files_processed"] == 3
+    assert meta["chunking"]["size"] == search.CHUNK_SIZE
+
+def test_only_file_on_index_without_file_table_keeps_corpus(corpus):
+    search.ingest_docs_to_json()
+    header = search.index_store.read_header(search.INDEX_BASE)
+    header["meta"].pop("files")
+    search.index_store._commit_header(search.INDEX_BASE, header)
+    search.INDEX.reload()
+
+    meta = search.ingest_docs_to_json(only_file="c.txt")["meta"]
+    assert sorted(meta["files"]) == sorted(corpus)
+
+def test_removed_file_is_dropped():
+    search.ingest_docs_to_json()
+    os.remove(os.path.join(search.DOCS_DIR, "c.txt"))
+    meta = search.ingest_docs_to_json()["meta"]
+    assert sorted(meta["files"]) == ["a.txt", "b.txt"]
+    assert meta["files_removed"] == ["c.txt"] and meta["files_reused"] == 2
+
+@pytest.mark.skipif(not hasattr(os, "mkfifo"), reason="needs a FIFO to stall extraction")
+def test_single_file_extraction_times_out_off_main_thread(tmp_path):
+    import threading
+
+    stuck = tmp_path / "stuck.txt"
+    os.mkfifo(stuck)          # opening it for reading blocks until a writer appears
+    out = []
+    t = threading.Thread(target=lambda: out.append(search._chunk_files([str(stuck)], str(tmp_path), workers=1, timeout=1)))
+    t.start()
+    t.join(60)
+    assert not t.is_alive()
+    assert out[0][0][1] == 0
+
+def test_reingest_within_a_second_gets_new_version_and_fresh_query_vectors():
+    search.ingest_docs_to_json()
+    v1 = search.get_index().version
+    old_vec, _ = search.embed_query("alpha1 bravo2")
+    with open(os.path.join(search.DOCS_DIR, "d.txt"), "w") as f:
+        f.write("alpha1 " * 300)
+    search.ingest_docs_to_json()
+    snap = search.get_index()
+    assert snap.version != v1
+    vec, version = search.embed_query("alpha1 bravo2")
+    assert version == snap.version
+    fresh = search._embed_local(["alpha1 bravo2"], idf=snap.local_idf, dim=snap.dim)[0]
+    assert list(vec) == list(fresh) and list(vec) != list(old_vec)
+
+def test_files_in_subdirectories_are_keyed_by_relative_path():
+    os.makedirs(os.path.join(search.DOCS_DIR, "reports"))
+    with open(os.path.join(search.DOCS_DIR, "reports", "a.txt"), "w") as f:
+        f.write("delta " * 400)
+    meta = search.ingest_docs_to_json()["meta"]
+    assert sorted(meta["files"]) == ["a.txt", "b.txt", "c.txt", "reports/a.txt"]
+    assert {r["source_path"] for r in search.get_index().records} == set(meta["files"])
+
+    results, _ = search.search_chunks("delta", 50, include=["reports/*.txt"])
+    assert results and {r["source_path"] for r in results} == {"reports/a.txt"}
+
+    with open(os.path.join(search.DOCS_DIR, "reports", "a.txt"), "w") as f:
+        f.write("echo " * 400)
+    meta = search.ingest_docs_to_json(only_file="reports/a.txt")["meta"]
+    assert meta["files_reused"] == 3 and meta["files_processed"] == 1
+
+def test_ingest_and_query_during_legacy_conversion_do_not_deadlock(monkeypatch):
+    import json
+    import threading
+
+    os.makedirs(search.DATA_DIR, exist_ok=True)
+    with open(search.DATA_PATH, "w") as f:
+        json.dump({"meta": {}, "records": [
+            {"source_path": "a.txt", "chunk_index": 0, "text": "alpha0 alpha1", "embedding": [1.0, 0.0]},
+        ]}, f)
+    monkeypatch.setattr(search.INDEX, "_snap", None)
+
+    # Hold ingest inside the writer lock until the query is waiting on it.
+    started, release = threading.Event(), threading.Event()
+    gather = search._gather_files
+    def gather_after_query():
+        started.set()
+        release.wait(5)
+        return gather()
+    monkeypatch.setattr(search, "_gather_files", gather_after_query)
+
+    out = {}
+    ingest = threading.Thread(target=lambda: out.update(meta=search.ingest_docs_to_json()["meta"]), daemon=True)
+    query = threading.Thread(target=lambda: out.update(hits=search.search_chunks("alpha1", 3)[0]), daemon=True)
+    ingest.start()
+    assert started.wait(5)
+    query.start()
+    query.join(0.5)
+    release.set()
+    ingest.join(30)
+    query.join(30)
+
+    assert not ingest.is_alive() and not query.is_alive()
+    assert out["meta"]["files_processed"] == 3
+    assert search.get_index().meta.get("converted_from") is None
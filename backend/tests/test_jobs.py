@@ -0,0 +1,36 @@
+import threading
+
+from jobs import IngestQueue
+
+def _blocked_queue():
+    """A queue whose first job blocks until released, so later ones wait."""
+    release, calls = threading.Event(), []
+
+    def runner(progress, **params):
+        calls.append(params)
+        release.wait(10)
+        return {"meta": {}}
+
+    q = IngestQueue(runner)
+    first = q.submit("reingest", only_file=None, force_openai=False)
+    while not calls:
+        threading.Event().wait(0.01)
+    return q, release, first, calls
+
+def test_coalesced_upload_keeps_queued_openai_reingest():
+    q, release, first, calls = _blocked_queue()
+    queued = q.submit("reingest", only_file=None, force_openai=True)
+    assert q.submit("upload", only_file="a.pdf", force_openai=False) is queued
+    assert queued.params == {"only_file": None, "force_openai": True}
+    release.set()
+    assert queued.done.wait(10)
+
+def test_coalescing_same_file_keeps_it_and_different_files_widen():
+    q, release, first, calls = _blocked_queue()
+    queued = q.submit("upload", only_file="a.pdf", force_openai=False)
+    q.submit("upload", only_file="a.pdf", force_openai=False)
+    assert queued.params["only_file"] == "a.pdf"
+    q.submit("upload", only_file="b.pdf", force_openai=False)
+    assert queued.params == {"only_file": None, "force_openai": False}
+    release.set()
+    assert queued.done.wait(10)
@@ -0,0 +1,45 @@
+import os
+
+import pytest
+
+import pain_index
+import search
+
+PAINS = {
+    "retail.txt": "Retailer pains: stockouts on fast movers, empty shelves and lost sales every weekend. " * 20,
+    "supply.txt": "Supplier delays stretch lead times; distributors chase late purchase orders. " * 20,
+    "data.txt": "Data silos between the POS, ERP and spreadsheets hide the true inventory position. " * 20,
+}
+
+@pytest.fixture
+def pains(corpus):
+    for fn, text in PAINS.items():
+        with open(os.path.join(search.DOCS_DIR, fn), "w") as f:
+            f.write(text)
+    search.ingest_docs_to_json()
+    assert search.get_index().pains is not None
+
+def _refs(results):
+    return [(r["source_path"], r["chunk_index"]) for r in results]
+
+@pytest.mark.usefixtures("pains")
+@pytest.mark.parametrize("mode", ["dense", "hybrid"])
+def test_single_option_lookup_matches_live_search(monkeypatch, mode):
+    monkeypatch.setattr(search, "SEARCH_MODE", mode)
+    for role, options in [("retailer", ["Stockouts"]), ("distributor", ["Supplier delays"]), ("retailer", [])]:
+        results, data, source = search.search_pains(role, options, 6)
+        live, live_data = search.search_chunks(pain_index.pain_query(role, options), 6)
+        assert source == "precomputed"
+        assert data["mode"] == live_data["mode"] == mode
+        assert _refs(results) == _refs(live)
+
+@pytest.mark.usefixtures("pains")
+@pytest.mark.parametrize("role, options", [
+    ("astronaut", ["Stockouts"]),
+    ("retailer", ["Stockouts", "Not in the question bank"]),
+])
+def test_unknown_role_or_option_searches_live(role, options):
+    results, _, source = search.search_pains(role, options, 6)
+    live, _ = search.search_chunks(pain_index.pain_query(role, options), 6)
+    assert source == "live"
+    assert _refs(results) == _refs(live)
@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+import index_store
+import vectors
+
+N, DIM, K = 2000, 64, 10
+
+def _corpus(seed=0):
+    """Unit rows plus queries that are slightly perturbed rows (as vectors.measure samples)."""
+    rng = np.random.default_rng(seed)
+    rows = rng.normal(size=(N, DIM)).astype(np.float32)
+    rows /= np.linalg.norm(rows, axis=1, keepdims=True)
+    queries = rows[rng.choice(N, size=20, replace=False)]
+    queries = queries + rng.normal(scale=0.05, size=queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return rows, queries
+
+def _view(tmp_path, rows, kind, keep_float32):
+    """Encode `rows` batch by batch through IndexWriter, as ingest does."""
+    writer = index_store.IndexWriter(str(tmp_path / "index"), storage=kind)
+    for s in range(0, N, 512):
+        writer.append([{"i": i} for i in range(s, min(N, s + 512))], rows[s:s + 512])
+    return writer.view(keep_float32)
+
+def _truth(rows, q):
+    return vectors.top_k(rows @ q, K)
+
+@pytest.mark.parametrize("kind", ["float16", "int8"])
+def test_blockwise_scores_match_full_dequantisation(tmp_path, monkeypatch, kind):
+    rows, queries = _corpus()
+    monkeypatch.setattr(vectors, "_BLOCK_CELLS", 100 * DIM)   # 100-row blocks
+    v = _view(tmp_path, rows, kind, keep_float32=False)
+    full = v[np.arange(N)]
+    ranges = [(150, 420), (1700, 1999)]
+    part = np.concatenate([full[lo:hi] for lo, hi in ranges])
+
+    np.testing.assert_allclose(v.scores(queries[0]), full @ queries[0], rtol=1e-5, atol=1e-6)
+    np.testing.assert_allclose(v.scores(queries[0], ranges), part @ queries[0], rtol=1e-5, atol=1e-6)
+    np.testing.assert_allclose(v.matmul(queries[:3], ranges), queries[:3] @ part.T, rtol=1e-5, atol=1e-6)
+
+@pytest.mark.parametrize("kind", ["float16", "int8"])
+def test_keep_float32_rescoring_recovers_exact_top_k(tmp_path, kind):
+    rows, queries = _corpus()
+    v = _view(tmp_path, rows, kind, keep_float32=True)
+    assert v.can_rescore()
+    for q in queries:
+        truth_rows, truth_scores = _truth(rows, q)
+        cand, _ = vectors.top_k(v.scores(q), K * vectors.EMBED_RESCORE_FACTOR)
+        got_rows, got_scores = v.rescore(cand, q)
+        assert got_rows[:K].tolist() == truth_rows.tolist()
+        np.testing.assert_allclose(got_scores[:K], truth_scores, rtol=1e-6)
+        np.testing.assert_allclose(v.exact_rows(truth_rows), rows[truth_rows], atol=1e-6)
+
+@pytest.mark.parametrize("kind", ["float16", "int8"])
+def test_without_float32_scores_stay_close_to_exact(tmp_path, kind):
+    rows, queries = _corpus()
+    v = _view(tmp_path, rows, kind, keep_float32=False)
+    assert v.exact is None and not v.can_rescore()
+    tol = 1e-3 if kind == "float16" else 2e-2
+    hits = 0
+    for q in queries:
+        approx = v.scores(q)
+        np.testing.assert_allclose(approx, rows @ q, atol=tol)
+        hits += len(set(vectors.top_k(approx, K)[0].tolist()) & set(_truth(rows, q)[0].tolist()))
+    assert hits / (K * len(queries)) >= 0.9
+
+def test_measure_reports_recall(tmp_path):
+    rows, _ = _corpus()
+    stats = vectors.measure(rows, _view(tmp_path, rows, "int8", keep_float32=True))
+    assert stats["compression"] > 3.5
+    assert stats["recall_at_10"] >= 0.9
+    assert stats["recall_at_10_rescored"] >= stats["recall_at_10"]
+
+@pytest.mark.parametrize("keep_float32", [True, False])
+def test_ingest_honours_keep_float32(monkeypatch, corpus, keep_float32):
+    import search
+
+    search.ingest_docs_to_json()
+    exact = search.get_index()
+    q = exact.matrix[3] + 0.01
+    truth = exact.dense(q, K)[0].tolist()
+
+    monkeypatch.setattr(vectors, "EMBED_STORAGE", "int8")
+    monkeypatch.setattr(vectors, "EMBED_KEEP_FLOAT32", keep_float32)
+    search.ingest_docs_to_json()
+    snap = search.get_index()
+    assert snap.vectors.kind == "int8"
+    assert snap.vectors.can_rescore() is keep_float32
+    assert snap.meta["storage"]["float32_kept"] is keep_float32
+    rows = snap.dense(q, K)[0].tolist()
+    if keep_float32:
+        assert rows == truth
+    else:
+        assert len(set(rows) & set(truth)) >= K - 2
@@ -4,12 +4,6 @@ import re
 from typing import List
 from pathlib import Path
 
-# Optional imports for different file types
-try:
-    from docx import Document as _DocxDocument  # python-docx
-except Exception:
-    _DocxDocument = None
-
 # --- Chunking controls via env ---
 CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "700"))         # default smaller chunks
 CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "150"))   # default overlap
@@ -59,9 +53,12 @@ def _read_pdf(path: str) -> str:
 
 
 def _read_docx(path: str) -> str:
-    if _DocxDocument is None:
+    # python-docx is optional and slow to import: load it only when a .docx is read
+    try:
+        from docx import Document
+    except Exception:
         return ""
-    doc = _DocxDocument(path)
+    doc = Document(path)
     parts = []
     for p in doc.paragraphs:
         txt = p.text.strip()
@@ -0,0 +1,214 @@
+# backend/vectors.py
+"""
+Compressed embedding storage for dense search.
+
+EMBED_STORAGE picks how the rows that queries scan are stored:
+
+    float32   the unit-row matrix itself (4 bytes per value)
+    float16   half precision (2 bytes per value)
+    int8      symmetric per-row quantisation: codes int8 [count, dim] plus
+              scales float32 [count], row ~= codes * scale (1 byte per value)
+
+Candidates are scored on the compressed rows, dequantised a block at a time
+so a query never materialises a float32 copy of the corpus. The float32
+matrix stays on disk (unless EMBED_KEEP_FLOAT32=false) and, with
+EMBED_RESCORE on, the top EMBED_RESCORE_FACTOR * k candidates are rescored
+against it exactly; only their pages are read.
+
+Memory use and the recall@10 lost to compression (with and without
+rescoring) are measured at ingest and stored under meta.storage.
+"""
+import os
+from typing import Dict, List, Optional, Tuple
+
+EMBED_STORAGE        = os.getenv("EMBED_STORAGE", "float32").lower()   # float32 | float16 | int8
+EMBED_KEEP_FLOAT32   = os.getenv("EMBED_KEEP_FLOAT32", "true").lower() == "true"
+EMBED_RESCORE        = os.getenv("EMBED_RESCORE", "true").lower() == "true"
+EMBED_RESCORE_FACTOR = int(os.getenv("EMBED_RESCORE_FACTOR", "4"))
+
+KINDS = ("float32", "float16", "int8")
+_BLOCK_CELLS = 8 * 1024 * 1024   # values dequantised at a time (32 MB as float32)
+
+def storage_kind(kind: Optional[str] = None) -> str:
+    kind = (kind or EMBED_STORAGE).lower()
+    if kind not in KINDS:
+        raise ValueError(f"EMBED_STORAGE must be one of {', '.join(KINDS)}; got {kind!r}")
+    return kind
+
+# -------------------------
+# Encoding
+# -------------------------
+def encode(matrix, kind: str) -> Dict:
+    """
+    Compressed arrays for a batch of unit rows: {"emb_f16"} or
+    {"emb_q8", "emb_scale"}. Rows are independent, so batches can be
+    encoded and appended one at a time.
+    """
+    import numpy as np
+
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if kind == "float16":
+        return {"emb_f16": matrix.astype(np.float16)}
+    if kind == "int8":
+        peak = np.abs(matrix).max(axis=1) if matrix.size else np.zeros(len(matrix), dtype=np.float32)
+        scale = (np.maximum(peak, 1e-12) / 127.0).astype(np.float32)
+        codes = np.clip(np.rint(matrix / scale[:, None]), -127, 127).astype(np.int8)
+        return {"emb_q8": codes, "emb_scale": scale}
+    return {}
+
+# -------------------------
+# Reading / scoring
+# -------------------------
+class Vectors:
+    """
+    Read-only view of the scanned embeddings of one index. Indexing returns
+    dequantised float32 rows, so callers written against the plain matrix
+    (e.g. ann.search) work unchanged.
+    """
+    def __init__(self, kind: str, data, scales=None, exact=None):
+        self.kind = kind
+        self.data = data          # [count, dim] float32 / float16 / int8
+        self.scales = scales      # [count] float32 (int8 only)
+        self.exact = exact if exact is not None and len(exact) == len(data) else None
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    @property
+    def dim(self) -> int:
+        return int(self.data.shape[1]) if self.data.ndim == 2 else 0
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes a full scan touches (what must stay resident for fast queries)."""
+        return int(self.data.nbytes) + (int(self.scales.nbytes) if self.scales is not None else 0)
+
+    def __getitem__(self, idx):
+        import numpy as np
+
+        rows = np.asarray(self.data[idx], dtype=np.float32)
+        if self.scales is not None:
+            rows *= np.asarray(self.scales[idx], dtype=np.float32)[..., None]
+        return rows
+
+    def exact_rows(self, idx):
+        """float32 rows: the stored full-precision ones if kept, else dequantised."""
+        import numpy as np
+
+        if self.exact is not None:
+            return np.asarray(self.exact[idx], dtype=np.float32)
+        return self[idx]
+
+    def _block_rows(self) -> int:
+        return max(1, _BLOCK_CELLS // max(1, self.dim))
+
+    def _blocks(self, ranges) -> List[Tuple[int, int]]:
+        """(lo, hi) row blocks covering `ranges` (default: all rows), at most one dequant block each."""
+        step = len(self) if self.kind == "float32" else self._block_rows()
+        out = []
+        for lo, hi in ranges if ranges is not None else [(0, len(self))]:
+            out.extend((s, min(hi, s + step)) for s in range(lo, hi, max(1, step)))
+        return out
+
+    def _block(self, lo: int, hi: int):
+        import numpy as np
+
+        return np.asarray(self.data[lo:hi], dtype=np.float32)
+
+    def scores(self, q, ranges: Optional[List[Tuple[int, int]]] = None):
+        """
+        Approximate cosine against unit vector q of every row, or of the rows
+        in `ranges` ([(lo, hi)], concatenated in order) only.
+        """
+        import numpy as np
+
+        if ranges is None and self.kind == "float32":
+            return self.data @ q
+        blocks = self._blocks(ranges)
+        out = np.empty(sum(hi - lo for lo, hi in blocks), dtype=np.float32)
+        pos = 0
+        for lo, hi in blocks:
+            out[pos:pos + hi - lo] = self._block(lo, hi) @ q
+            if self.scales is not None:
+                out[pos:pos + hi - lo] *= self.scales[lo:hi]
+            pos += hi - lo
+        return out
+
+    def matmul(self, Q, ranges: Optional[List[Tuple[int, int]]] = None):
+        """Q @ rows.T for a [queries, dim] float32 block: [queries, rows (in `ranges`)]."""
+        import numpy as np
+
+        if ranges is None and self.kind == "float32":
+            return Q @ self.data.T
+        blocks = self._blocks(ranges)
+        out = np.empty((len(Q), sum(hi - lo for lo, hi in blocks)), dtype=np.float32)
+        pos = 0
+        for lo, hi in blocks:
+            out[:, pos:pos + hi - lo] = Q @ self._block(lo, hi).T
+            if self.scales is not None:
+                out[:, pos:pos + hi - lo] *= np.asarray(self.scales[lo:hi], dtype=np.float32)
+            pos += hi - lo
+        return out
+
+    def can_rescore(self) -> bool:
+        return self.kind != "float32" and self.exact is not None
+
+    def rescore(self, rows, q) -> Tuple:
+        """Exact (rows, scores) for candidate rows, best first."""
+        import numpy as np
+
+        rows = np.sort(np.asarray(rows, dtype=np.int64))   # sequential page access
+        scores = np.asarray(self.exact[rows], dtype=np.float32) @ q
+        order = np.argsort(-scores, kind="stable")
+        return rows[order], scores[order]
+
+def top_k(scores, k: int) -> Tuple:
+    """(indices, scores) of the k largest scores, best first."""
+    import numpy as np
+
+    k = min(k, len(scores))
+    idx = np.argpartition(-scores, k - 1)[:k]
+    idx = idx[np.argsort(-scores[idx], kind="stable")]
+    return idx, scores[idx]
+
+# -------------------------
+# Evaluation
+# -------------------------
+def measure(exact, vectors: Vectors, k: int = 10, n_queries: int = 100, seed: int = 0) -> Dict:
+    """
+    Memory and recall@k of compressed scoring against exact float32
+    scoring, with sampled (slightly perturbed) indexed rows as queries.
+    """
+    import numpy as np
+
+    n, dim = len(exact), vectors.dim
+    out = {
+        "kind": vectors.kind,
+        "bytes": vectors.nbytes,
+        "float32_bytes": int(n * dim * 4),
+        "float32_kept": vectors.exact is not None or vectors.kind == "float32",
+        "rescore_factor": EMBED_RESCORE_FACTOR if vectors.can_rescore() else None,
+    }
+    out["compression"] = round(out["float32_bytes"] / out["bytes"], 2) if out["bytes"] else None
+    if vectors.kind == "float32" or n == 0:
+        return out
+
+    k = min(k, n)
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(n, size=min(n_queries, n), replace=False)
+    queries = np.asarray(exact[np.sort(picks)], dtype=np.float32)
+    queries += rng.normal(scale=0.01, size=queries.shape).astype(np.float32)
+    queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-8)
+
+    hits = hits_rescored = 0
+    for q in queries:
+        truth = set(top_k(exact @ q, k)[0].tolist())
+        approx = vectors.scores(q)
+        hits += len(truth & set(top_k(approx, k)[0].tolist()))
+        if vectors.can_rescore():
+            cand, _ = top_k(approx, k * EMBED_RESCORE_FACTOR)
+            hits_rescored += len(truth & set(vectors.rescore(cand, q)[0][:k].tolist()))
+    total = float(k * len(queries))
+    out["recall_at_10"] = round(hits / total, 4)
+    out["recall_at_10_rescored"] = round(hits_rescored / total, 4) if vectors.can_rescore() else None
+    return out